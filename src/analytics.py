@@ -0,0 +1,174 @@
+import threading
+from datetime import date, datetime, time, timedelta
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+class HistoryAnalytics:
+    """Trend and heatmap aggregates over the usage history, memoized.
+
+    ``summary(start_day, end_day)`` is cached per range. Every day's
+    hour-of-day split is cached too, since that's the part that walks the
+    sessions. Past days don't change, so ``touch(day)`` drops only that
+    day's hours and the cached ranges that include it. The tracker touches
+    today as it records, so reopening a multi-year range just redoes today.
+    ``sessions`` returns the tracker's IntervalIndex, or None while it is
+    still loading; hours aren't cached then, and the result says
+    ``hours_pending`` so it can be asked for again. Without ``sessions``
+    the hour heatmaps are left empty.
+
+    ``summary`` does real work on a cache miss, so call it off the Tk thread.
+    """
+
+    def __init__(self, store, sessions=None, top_n=5, rolling_days=7):
+        if numpy is None:
+            raise RuntimeError("History analytics need numpy")
+        self.store = store
+        self.sessions = sessions
+        self.top_n = top_n
+        self.rolling_days = rolling_days
+        self.hours = {}
+        self.results = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'cached_days': len(self.hours),
+        }
+
+    def touch(self, day):
+        with self.lock:
+            self.dirty.add(day)
+
+    def reset(self):
+        with self.lock:
+            self.hours.clear()
+            self.results.clear()
+            self.dirty.clear()
+
+    def _invalidate(self):
+        for day in self.dirty:
+            self.hours.pop(day, None)
+            for start_day, end_day in list(self.results):
+                if start_day <= day <= end_day:
+                    del self.results[(start_day, end_day)]
+        self.dirty.clear()
+
+    def summary(self, start_day, end_day):
+        key = (start_day, end_day)
+        with self.lock:
+            self._invalidate()
+            cached = self.results.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+        result = self._compute(start_day, end_day)
+        if not result['hours_pending']:
+            with self.lock:
+                # A touch that landed mid-compute is handled on the next call.
+                self.results[key] = result
+        return result
+
+    def _compute(self, start_day, end_day):
+        first = date.fromisoformat(start_day)
+        count = (date.fromisoformat(end_day) - first).days + 1
+        days = [first + timedelta(days=i) for i in range(count)]
+        labels = [day.isoformat() for day in days]
+
+        totals = self.store.usage_between(start_day, end_day, group_by='day')
+        daily = numpy.array([totals.get(label, 0.0) for label in labels])
+        weekday = numpy.array([day.weekday() for day in days])
+        weekday_count = numpy.maximum(numpy.bincount(weekday, minlength=7), 1)
+
+        week_keys = [f"{year}-W{week:02d}" for year, week, _ in (day.isocalendar() for day in days)]
+        weeks, week_index = numpy.unique(week_keys, return_inverse=True)
+        months, month_index = numpy.unique([label[:7] for label in labels], return_inverse=True)
+
+        # Rolling mean over however many days are available at the start.
+        window = self.rolling_days
+        cumulative = numpy.concatenate(([0.0], numpy.cumsum(daily)))
+        span = numpy.minimum(numpy.arange(1, count + 1), window)
+        rolling = (cumulative[1:] - cumulative[numpy.arange(1, count + 1) - span]) / span
+
+        hours, pending = self._hours(labels, days)
+        weekday_hour = numpy.zeros((7, 24))
+        numpy.add.at(weekday_hour, weekday, hours)
+
+        app_trends = {}
+        for app, _ in self.store.top_apps(self.top_n, start_day, end_day):
+            series = self.store.usage_between(start_day, end_day, group_by='day', app=app)
+            app_daily = numpy.array([series.get(label, 0.0) for label in labels])
+            app_trends[app] = numpy.bincount(week_index, weights=app_daily, minlength=len(weeks)).tolist()
+
+        return {
+            'days': labels,
+            'daily': daily.tolist(),
+            'rolling': rolling.tolist(),
+            'weeks': weeks.tolist(),
+            'weekly': numpy.bincount(week_index, weights=daily, minlength=len(weeks)).tolist(),
+            'months': months.tolist(),
+            'monthly': numpy.bincount(month_index, weights=daily, minlength=len(months)).tolist(),
+            'day_of_week': (numpy.bincount(weekday, weights=daily, minlength=7) / weekday_count).tolist(),
+            'hour_of_day': (hours.sum(axis=0) / count).tolist(),
+            'weekday_hour': (weekday_hour / weekday_count[:, None]).tolist(),
+            'app_trends': app_trends,
+            'hours_pending': pending,
+        }
+
+    def _hours(self, labels, days):
+        # One vectorized pass over the sessions for all the days not cached yet.
+        # Days past session retention come from the store's hourly buckets.
+        with self.lock:
+            missing = [i for i, label in enumerate(labels) if label not in self.hours]
+        floor = getattr(self.store, 'session_floor', 0)
+        if floor and missing:
+            midnight = lambda i: datetime.combine(days[i] + timedelta(days=1), time()).timestamp()
+            old = [i for i in missing if midnight(i) <= floor]
+            if old:
+                self._bucketed_hours(labels, days, old)
+                missing = [i for i in missing if midnight(i) > floor]
+        index = self.sessions() if self.sessions else None
+        pending = bool(missing) and self.sessions is not None and index is None
+        if missing and not pending:
+            if index is None:
+                computed = numpy.zeros((len(missing), 24))
+            else:
+                bounds = [datetime.combine(days[i], time(hour)).timestamp()
+                          for i in missing for hour in range(24)]
+                bounds += [datetime.combine(days[i] + timedelta(days=1), time()).timestamp() for i in missing]
+                covered = numpy.asarray(index.covered_before(bounds))
+                hour_starts = covered[:len(missing) * 24].reshape(-1, 24)
+                day_ends = covered[len(missing) * 24:]
+                hour_ends = numpy.column_stack((hour_starts[:, 1:], day_ends))
+                computed = hour_ends - hour_starts
+            with self.lock:
+                for row, i in zip(computed, missing):
+                    self.hours[labels[i]] = row
+        with self.lock:
+            return numpy.array([self.hours.get(label, numpy.zeros(24)) for label in labels]), pending
+
+    def _bucketed_hours(self, labels, days, missing):
+        start = datetime.combine(days[missing[0]], time()).timestamp()
+        end = datetime.combine(days[missing[-1]] + timedelta(days=1), time()).timestamp()
+        buckets = self.store.hourly_usage(start, end)
+        computed = {labels[i]: numpy.zeros(24) for i in missing}
+        for hour, seconds in buckets.items():
+            moment = datetime.fromtimestamp(hour)
+            row = computed.get(moment.date().isoformat())
+            if row is not None:
+                row[moment.hour] += seconds
+        with self.lock:
+            self.hours.update(computed)
@@ -1,17 +1,56 @@
+import time
+STARTED = time.perf_counter()
+
+import argparse
 import tkinter as tk
-from tkinter import ttk, messagebox
-import json
+from tkinter import ttk, messagebox, filedialog
+from datetime import datetime, timedelta
 import os
-from datetime import datetime
 import threading
-import time
-import psutil
-from collections import defaultdict
-import win32gui
-import win32process
+from storage import open_store, write_json_atomic
+from analytics import WEEKDAYS, HistoryAnalytics
+from categories import format_rules, parse_rules
+from events import ChangeChannel
+from metrics import METRICS_NAME, Metrics, format_snapshot
+from probe import ReplayProbe, make_probe, missing_dependencies
+from scheduler import SampleScheduler
+from timers import TimerQueue
+from titles import OTHER_TITLE
+from tracker import UsageTracker
+from transfer import LEDGER_NAME, ImportLedger, export_history, forget_imports, import_history
+
+EXPORT_FILETYPES = [("NDJSON", "*.ndjson *.ndjson.gz *.ndjson.zst"), ("CSV", "*.csv *.csv.gz *.csv.zst"),
+                    ("All files", "*")]
+
+
+class StartupProfile:
+    """Times each startup phase for --profile-startup; does nothing otherwise."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.last = STARTED
+        self.phases = []
+
+    def mark(self, phase):
+        if self.enabled:
+            now = time.perf_counter()
+            self.phases.append((phase, now - self.last))
+            self.last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        for phase, seconds in self.phases:
+            print(f"{phase:<24}{seconds * 1000:9.1f} ms")
+        print(f"{'first frame':<24}{(self.last - STARTED) * 1000:9.1f} ms")
+
 
 class TesseractApp:
-    def __init__(self):
+    def __init__(self, storage='log', probe='win32', trace=None, frame_budget=0.5, connect=None,
+                 profile=None, metrics=None):
+        self.profile = profile or StartupProfile()
+        self.metrics = metrics
+        self.profile.mark("imports")
         self.root = tk.Tk()
         self.root.title("Tesseract")
         self.root.geometry("1000x700")
@@ -19,25 +58,80 @@ class TesseractApp:
         self.root.resizable(True, True)
         
         self.data_file = "tesseract_data.json"
-        self.app_usage = defaultdict(int)
-        self.daily_usage = defaultdict(int)
+        self.data_dir = "tesseract_data"
         self.session_start = datetime.now()
-        self.current_app = ""
-        self.last_check = datetime.now()
+        self.changes = ChangeChannel(self.schedule_update, frame_budget=frame_budget)
+        if connect:
+            # Thin client: a running collector does the tracking and owns the data.
+            from client import CollectorClient, RemoteStore, RemoteTracker
+            from collector import load_token
+            client = CollectorClient(connect, token=load_token(self.data_dir))
+            self.store = RemoteStore(client)
+            self.timers = TimerQueue()
+            self.tracker = RemoteTracker(client, self.store, self.changes)
+        else:
+            self.store = open_store(storage, self.data_dir, legacy_file=self.data_file)
+            self.start_local_tracker(probe, trace)
         
         self.break_interval = 60
         self.break_reminder_active = False
-        self.break_thread = None
+        self.break_timer = None
         
         self.app_limits = {}
-        self.is_tracking = True
         self.tracking_thread = None
+        self.rendered_rows = {}
+        self.limit_usage = {}
+        self.limit_apps = []
+        self.limits_listbox = None
+        self.lazy_tabs = {}
+        self.analytics_canvas = None
+        self.analytics_busy = False
+        self.diagnostics_text = None
+        try:
+            sessions = None
+            if isinstance(self.tracker, UsageTracker):
+                sessions = lambda: self.tracker.sessions if self.tracker.history_merged.is_set() else None
+            self.analytics = HistoryAnalytics(self.store, sessions)
+        except RuntimeError:
+            self.analytics = None
+        if self.metrics:
+            if self.analytics:
+                self.metrics.add_source('analytics_cache', self.analytics.stats)
+            self.metrics.start_dump(self.timers, os.path.join(self.data_dir, METRICS_NAME))
+        self.profile.mark("window")
         
         self.setup_styles()
         self.load_data()
+        self.profile.mark("summary")
         self.create_widgets()
+        self.tracker.publish_all()
+        self.timers.start()
         self.start_tracking()
-        self.update_display()
+        self.profile.mark("widgets")
+        self.root.after_idle(self.first_frame)
+
+    def first_frame(self):
+        self.profile.mark("first paint")
+        self.profile.report()
+        if self.profile.enabled:
+            threading.Thread(target=self.report_history, daemon=True).start()
+
+    def report_history(self):
+        self.store.history_loaded.wait()
+        print(f"{'history (background)':<24}{(time.perf_counter() - STARTED) * 1000:9.1f} ms")
+
+    def start_local_tracker(self, probe, trace):
+        window_probe = make_probe(probe, trace)
+        if isinstance(window_probe, ReplayProbe):
+            # Replay on the recorded timeline rather than the wall clock.
+            self.timers = TimerQueue(clock=window_probe.monotonic)
+            self.tracker = UsageTracker(self.store, window_probe, clock=window_probe.now,
+                                        scheduler=SampleScheduler(monotonic=window_probe.monotonic),
+                                        channel=self.changes, timers=self.timers, metrics=self.metrics)
+        else:
+            self.timers = TimerQueue()
+            self.tracker = UsageTracker(self.store, window_probe, channel=self.changes, timers=self.timers,
+                                        metrics=self.metrics)
 
     def setup_styles(self):
         # Earth-themed colors
@@ -101,77 +195,29 @@ class TesseractApp:
                         thickness=20)
 
     def load_data(self):
+        # Usage history stays in the store and is read back through its query
+        # API; only the (small) limits and settings are kept on the app.
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                    self.app_usage = defaultdict(int, data.get('app_usage', {}))
-                    self.daily_usage = defaultdict(int, data.get('daily_usage', {}))
-                    self.app_limits = data.get('app_limits', {})
-                    self.break_interval = data.get('break_interval', 60)
-        except:
-            pass
+            self.tracker.load_data(lazy=True)
+            self.app_limits = self.store.app_limits
+            self.break_interval = self.store.get_setting('break_interval', 60)
+        except Exception as e:
+            if self.metrics:
+                self.metrics.error('load', e)
 
     def save_data(self):
-        try:
-            data = {
-                'app_usage': dict(self.app_usage),
-                'daily_usage': dict(self.daily_usage),
-                'app_limits': self.app_limits,
-                'break_interval': self.break_interval,
-                'last_saved': datetime.now().isoformat()
-            }
-            with open(self.data_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except:
-            pass
-
-    def get_active_window(self):
-        try:
-            hwnd = win32gui.GetForegroundWindow()
-            if hwnd:
-                _, pid = win32process.GetWindowThreadProcessId(hwnd)
-                process = psutil.Process(pid)
-                return process.name()
-        except:
-            return "Unknown"
-        return "Unknown"
-
-    def track_usage(self):
-        while self.is_tracking:
-            try:
-                current_app = self.get_active_window()
-                current_time = datetime.now()
-                time_diff = (current_time - self.last_check).total_seconds()
-                if current_app and time_diff < 5:
-                    self.app_usage[current_app] += time_diff
-                    today = current_time.strftime("%Y-%m-%d")
-                    self.daily_usage[today] += time_diff
-                    self.check_app_limits(current_app)
-                self.current_app = current_app
-                self.last_check = current_time
-                if int(time_diff) % 30 == 0:
-                    self.save_data()
-            except:
-                pass
-            time.sleep(1)
-
-    def check_app_limits(self, app_name):
-        if app_name in self.app_limits:
-            usage_minutes = self.app_usage[app_name] / 60
-            limit_minutes = self.app_limits[app_name]
-            if usage_minutes > limit_minutes and usage_minutes % 5 < 0.1:
-                self.show_limit_warning(app_name, limit_minutes)
+        self.tracker.save_data()
 
-    def show_limit_warning(self, app_name, limit):
+    def show_limit_warning(self, app_name, limit, daily=True):
+        period = "today" if daily else "in total"
         messagebox.showwarning(
             "Time's Up! ⏰",
-            f"You've been using {app_name} for over {limit} minutes today.\nMaybe time for a break? 🌿"
+            f"You've been using {app_name} for over {limit} minutes {period}.\nMaybe time for a break? 🌿"
         )
 
     def start_tracking(self):
         if not self.tracking_thread or not self.tracking_thread.is_alive():
-            self.tracking_thread = threading.Thread(target=self.track_usage, daemon=True)
+            self.tracking_thread = threading.Thread(target=self.tracker.track_usage, daemon=True)
             self.tracking_thread.start()
 
     def format_time(self, seconds):
@@ -184,10 +230,6 @@ class TesseractApp:
             minutes = int((seconds % 3600)/60)
             return f"{hours}h {minutes}m"
 
-    def get_total_screen_time_today(self):
-        today = datetime.now().strftime("%Y-%m-%d")
-        return self.daily_usage.get(today, 0)
-
     def create_widgets(self):
         main_container = tk.Frame(self.root, bg=self.colors['bg'])
         main_container.pack(fill='both', expand=True, padx=20, pady=20)
@@ -200,8 +242,32 @@ class TesseractApp:
         self.notebook = ttk.Notebook(main_container, style='Custom.TNotebook')
         self.notebook.pack(fill='both', expand=True)
         self.create_dashboard_tab()
-        self.create_limits_tab()
-        self.create_settings_tab()
+        self.add_lazy_tab("  App Limits  ", self.create_limits_tab)
+        self.add_lazy_tab("  Analytics  ", self.create_analytics_tab)
+        self.add_lazy_tab("  Settings  ", self.create_settings_tab)
+        self.add_lazy_tab("  Diagnostics  ", self.create_diagnostics_tab)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+
+    # --- Tabs are built the first time they're shown ---
+    def add_lazy_tab(self, text, build):
+        frame = tk.Frame(self.notebook, bg=self.colors['bg'])
+        self.notebook.add(frame, text=text)
+        self.lazy_tabs[str(frame)] = (frame, build)
+
+    def on_tab_changed(self, event):
+        key = self.notebook.select()
+        tab = self.lazy_tabs.get(key)
+        if tab:
+            frame, build = tab
+            try:
+                build(frame)
+            except Exception:
+                # E.g. the collector is unreachable; start over next time
+                # the tab is selected.
+                for child in frame.winfo_children():
+                    child.destroy()
+                raise
+            del self.lazy_tabs[key]
 
     # --- Card Helper ---
     def create_card_frame(self, parent, title):
@@ -261,14 +327,12 @@ class TesseractApp:
         self.app_listbox.pack(fill='both', expand=True)
 
     # --- Limits Tab ---
-    def create_limits_tab(self):
-        limits_frame = tk.Frame(self.notebook, bg=self.colors['bg'])
-        self.notebook.add(limits_frame, text="  App Limits  ")
+    def create_limits_tab(self, limits_frame):
         add_card = self.create_card_frame(limits_frame, "Set New Limit")
         input_frame = tk.Frame(add_card, bg=self.colors['surface'])
         input_frame.pack(fill='x', pady=20)
 
-        tk.Label(input_frame, text="App Name:", 
+        tk.Label(input_frame, text="App Name (or @Category):", 
                 bg=self.colors['surface'], 
                 fg=self.colors['text_primary'],
                 font=('Segoe UI', 11)).pack(anchor='w', pady=(0, 5))
@@ -292,6 +356,14 @@ class TesseractApp:
                                         insertbackground=self.colors['text_primary'])
         self.time_limit_entry.pack(fill='x', ipady=8, pady=(0, 15))
 
+        self.daily_limit_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(input_frame, text="Reset every day",
+                       variable=self.daily_limit_var,
+                       bg=self.colors['surface'],
+                       fg=self.colors['text_primary'],
+                       activebackground=self.colors['surface'],
+                       font=('Segoe UI', 11)).pack(anchor='w', pady=(0, 15))
+
         set_btn = tk.Button(input_frame, text="Set Limit",
                            bg=self.colors['accent'],
                            fg=self.colors['text_primary'],
@@ -323,10 +395,189 @@ class TesseractApp:
                               command=self.remove_app_limit)
         remove_btn.pack(fill='x')
 
+        rules_card = self.create_card_frame(limits_frame, "Categories")
+        tk.Label(rules_card, text="One rule per line, e.g. \"Browsers: glob chrome.exe\", "
+                                  "\"Games: regex game\" or \"Video: title regex youtube\" (title rules need "
+                                  "window-title tracking on in Settings). "
+                                  "A limit on @Browsers covers every app in it.",
+                 bg=self.colors['surface'],
+                 fg=self.colors['text_secondary'],
+                 font=('Segoe UI', 10),
+                 justify='left', wraplength=800).pack(anchor='w', pady=(0, 5))
+        self.rules_text = tk.Text(rules_card, height=6, bd=0,
+                                  bg=self.colors['primary'],
+                                  fg=self.colors['text_primary'],
+                                  font=('Consolas', 10),
+                                  insertbackground=self.colors['text_primary'])
+        self.rules_text.insert('1.0', format_rules(self.store.get_setting('category_rules') or []))
+        self.rules_text.pack(fill='both', expand=True, pady=(0, 10))
+        tk.Button(rules_card, text="Save Rules",
+                  bg=self.colors['accent'],
+                  fg=self.colors['text_primary'],
+                  font=('Segoe UI', 10),
+                  bd=0,
+                  pady=8,
+                  cursor='hand2',
+                  command=self.save_category_rules).pack(fill='x')
+        self.update_limits_display()
+
+    # --- Analytics Tab ---
+    ANALYTICS_RANGES = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "Last year": 365}
+
+    def create_analytics_tab(self, analytics_frame):
+        card = self.create_card_frame(analytics_frame, "History")
+        controls = tk.Frame(card, bg=self.colors['surface'])
+        controls.pack(fill='x', pady=(0, 10))
+        self.analytics_range = ttk.Combobox(controls, values=list(self.ANALYTICS_RANGES),
+                                            state='readonly', width=14)
+        self.analytics_range.set("Last 30 days")
+        self.analytics_range.bind('<<ComboboxSelected>>', lambda event: self.refresh_analytics())
+        self.analytics_range.pack(side='left')
+        tk.Button(controls, text="Refresh",
+                  bg=self.colors['primary'],
+                  fg=self.colors['text_primary'],
+                  font=('Segoe UI', 10),
+                  bd=0,
+                  padx=12,
+                  cursor='hand2',
+                  command=self.refresh_analytics).pack(side='left', padx=10)
+        self.analytics_status = tk.Label(controls, text="",
+                                         bg=self.colors['surface'],
+                                         fg=self.colors['text_secondary'],
+                                         font=('Segoe UI', 10))
+        self.analytics_status.pack(side='left')
+
+        canvas_options = {'bg': self.colors['surface'], 'highlightthickness': 0}
+        self.analytics_canvas = tk.Canvas(card, height=150, **canvas_options)
+        self.analytics_canvas.pack(fill='x', pady=(0, 10))
+        bottom = tk.Frame(card, bg=self.colors['surface'])
+        bottom.pack(fill='both', expand=True)
+        self.heatmap_canvas = tk.Canvas(bottom, height=170, width=420, **canvas_options)
+        self.heatmap_canvas.pack(side='left', fill='y')
+        self.trends_canvas = tk.Canvas(bottom, height=170, **canvas_options)
+        self.trends_canvas.pack(side='left', fill='both', expand=True, padx=(10, 0))
+        self.analytics_summary = tk.Label(card, text="", justify='left', anchor='w',
+                                          bg=self.colors['surface'],
+                                          fg=self.colors['text_primary'],
+                                          font=('Segoe UI', 10))
+        self.analytics_summary.pack(fill='x', pady=(10, 0))
+        self.refresh_analytics()
+
+    def refresh_analytics(self):
+        if not self.analytics:
+            self.analytics_status.config(text="Install numpy to see history analytics")
+            return
+        if self.analytics_busy:
+            return
+        self.analytics_busy = True
+        self.analytics_status.config(text="Crunching...")
+        days = self.ANALYTICS_RANGES[self.analytics_range.get()]
+        today = datetime.now().date()
+        start_day = (today - timedelta(days=days - 1)).isoformat()
+
+        def compute():
+            try:
+                result = self.analytics.summary(start_day, today.isoformat())
+                result['titles'] = self.top_titles(start_day, today.isoformat())
+            except Exception as e:
+                result = e
+            self.root.after(0, lambda: self.show_analytics(result))
+        threading.Thread(target=compute, daemon=True).start()
+
+    def show_analytics(self, result):
+        self.analytics_busy = False
+        if isinstance(result, Exception):
+            self.analytics_status.config(text=f"Couldn't compute analytics: {result}")
+            return
+        if result['hours_pending']:
+            # History is still loading; the hour heatmaps fill in on a retry.
+            self.analytics_status.config(text="Loading hour detail...")
+            self.root.after(2000, self.refresh_analytics)
+        else:
+            self.analytics_status.config(text="")
+        self.draw_daily_chart(result)
+        self.draw_heatmap(result['weekday_hour'])
+        self.draw_app_trends(result['weeks'], result['app_trends'])
+        weeks = "   ".join(f"{week}: {self.format_time(seconds)}"
+                           for week, seconds in list(zip(result['weeks'], result['weekly']))[-4:])
+        months = "   ".join(f"{month}: {self.format_time(seconds)}"
+                            for month, seconds in list(zip(result['months'], result['monthly']))[-3:])
+        busiest = max(range(7), key=lambda i: result['day_of_week'][i])
+        peak = max(range(24), key=lambda h: result['hour_of_day'][h])
+        text = (f"Weekly: {weeks}\nMonthly: {months}\n"
+                f"Busiest day: {WEEKDAYS[busiest]}   Peak hour: {peak:02d}:00")
+        if result['titles']:
+            text += "\nTop windows: " + "   ".join(f"{title} ({app.replace('.exe', '')}): {self.format_time(seconds)}"
+                                                 for app, title, seconds in result['titles'])
+        self.analytics_summary.config(text=text)
+
+    def top_titles(self, start_day, end_day, n=5):
+        # Only filled in while window titles are being tracked.
+        usage = self.store.title_usage(start_day, end_day)
+        rows = [(app, title, seconds) for app, titles in usage.items()
+                for title, seconds in titles.items() if not title.startswith(OTHER_TITLE)]
+        return sorted(rows, key=lambda row: row[2], reverse=True)[:n]
+
+    def draw_daily_chart(self, result):
+        canvas = self.analytics_canvas
+        canvas.delete('all')
+        width = max(canvas.winfo_width(), 400)
+        height = int(canvas['height'])
+        daily, rolling = result['daily'], result['rolling']
+        top = max(daily + rolling + [1])
+        step = width / len(daily)
+        for i, seconds in enumerate(daily):
+            bar = (height - 20) * seconds / top
+            canvas.create_rectangle(i * step + 1, height - bar, (i + 1) * step - 1, height,
+                                    fill=self.colors['accent'], outline='')
+        points = []
+        for i, seconds in enumerate(rolling):
+            points += [(i + 0.5) * step, height - (height - 20) * seconds / top]
+        if len(points) >= 4:
+            canvas.create_line(*points, fill=self.colors['text_primary'], width=2)
+        canvas.create_text(4, 4, anchor='nw', fill=self.colors['text_secondary'], font=('Segoe UI', 9),
+                           text=f"Daily screen time, {len(daily)}-day view (line: rolling average)")
+
+    def draw_heatmap(self, matrix):
+        canvas = self.heatmap_canvas
+        canvas.delete('all')
+        top = max(max(row) for row in matrix) or 1
+        cell, left, upper = 15, 34, 18
+        for hour in range(0, 24, 6):
+            canvas.create_text(left + hour * cell, 2, anchor='nw', text=f"{hour:02d}",
+                               fill=self.colors['text_secondary'], font=('Segoe UI', 8))
+        for day, row in enumerate(matrix):
+            y = upper + day * (cell + 4)
+            canvas.create_text(2, y, anchor='nw', text=WEEKDAYS[day],
+                               fill=self.colors['text_secondary'], font=('Segoe UI', 8))
+            for hour, seconds in enumerate(row):
+                shade = int(230 - 170 * seconds / top)
+                canvas.create_rectangle(left + hour * cell, y, left + (hour + 1) * cell - 1, y + cell,
+                                        fill=f"#{shade:02x}{min(shade + 30, 255):02x}{shade:02x}", outline='')
+
+    def draw_app_trends(self, weeks, trends):
+        canvas = self.trends_canvas
+        canvas.delete('all')
+        width = max(canvas.winfo_width(), 300)
+        height = int(canvas['height'])
+        palette = [self.colors['primary'], self.colors['danger'], self.colors['warning'],
+                   self.colors['success'], self.colors['text_primary']]
+        top = max([max(series) for series in trends.values()] + [1])
+        step = width / max(len(weeks) - 1, 1)
+        for n, (app, series) in enumerate(trends.items()):
+            color = palette[n % len(palette)]
+            points = []
+            for i, seconds in enumerate(series):
+                points += [i * step, height - 10 - (height - 30) * seconds / top]
+            if len(points) >= 4:
+                canvas.create_line(*points, fill=color, width=2)
+            else:
+                canvas.create_oval(points[0] - 3, points[1] - 3, points[0] + 3, points[1] + 3, fill=color, outline='')
+            canvas.create_text(4, 4 + n * 14, anchor='nw', fill=color, font=('Segoe UI', 9, 'bold'),
+                               text=app.replace('.exe', '').title())
+
     # --- Settings Tab ---
-    def create_settings_tab(self):
-        settings_frame = tk.Frame(self.notebook, bg=self.colors['bg'])
-        self.notebook.add(settings_frame, text="  Settings  ")
+    def create_settings_tab(self, settings_frame):
         break_card = self.create_card_frame(settings_frame, "Break Reminders")
         tk.Label(break_card, text="Reminder Interval (minutes):",
                 bg=self.colors['surface'],
@@ -334,6 +585,7 @@ class TesseractApp:
                 font=('Segoe UI', 11)).pack(anchor='w', pady=(0, 5))
 
         self.break_interval_var = tk.StringVar(value=str(self.break_interval))
+        self.break_interval_var.trace_add('write', self.on_break_interval_changed)
         interval_entry = tk.Entry(break_card,
                                  textvariable=self.break_interval_var,
                                  bg=self.colors['primary'],
@@ -353,6 +605,16 @@ class TesseractApp:
                                      command=self.toggle_break_reminders)
         self.break_button.pack(fill='x', pady=(0, 10))
 
+        titles_card = self.create_card_frame(settings_frame, "Window Titles")
+        self.title_tracking_var = tk.BooleanVar(value=bool(self.store.get_setting('title_tracking')))
+        tk.Checkbutton(titles_card, text="Track time per window title (stays on this machine)",
+                       variable=self.title_tracking_var,
+                       command=self.toggle_title_tracking,
+                       bg=self.colors['surface'],
+                       fg=self.colors['text_primary'],
+                       activebackground=self.colors['surface'],
+                       font=('Segoe UI', 11)).pack(anchor='w')
+
         data_card = self.create_card_frame(settings_frame, "Data Management")
         export_btn = tk.Button(data_card, text="Export Data",
                               bg=self.colors['primary'],
@@ -364,6 +626,16 @@ class TesseractApp:
                               command=self.export_data)
         export_btn.pack(fill='x', pady=5)
 
+        import_btn = tk.Button(data_card, text="Import Data",
+                              bg=self.colors['primary'],
+                              fg=self.colors['text_primary'],
+                              font=('Segoe UI', 10),
+                              bd=0,
+                              pady=8,
+                              cursor='hand2',
+                              command=self.import_data)
+        import_btn.pack(fill='x', pady=5)
+
         clear_btn = tk.Button(data_card, text="Clear All Data",
                              bg=self.colors['danger'],
                              fg=self.colors['text_primary'],
@@ -374,6 +646,42 @@ class TesseractApp:
                              command=self.clear_data)
         clear_btn.pack(fill='x', pady=5)
 
+    # --- Diagnostics Tab ---
+    def create_diagnostics_tab(self, diagnostics_frame):
+        card = self.create_card_frame(diagnostics_frame, "Diagnostics")
+        self.diagnostics_frame = diagnostics_frame
+        self.diagnostics_text = tk.Text(card, height=20, wrap='none', bd=0,
+                                        bg=self.colors['surface'],
+                                        fg=self.colors['text_primary'],
+                                        font=('Consolas', 10))
+        self.diagnostics_text.pack(fill='both', expand=True)
+        self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        # Refreshed every couple of seconds, but only while the tab is showing.
+        if self.notebook.select() != str(self.diagnostics_frame):
+            self.root.after(2000, self.refresh_diagnostics)
+            return
+        if self.metrics:
+            lines = format_snapshot(self.metrics.snapshot())
+            lines.insert(0, f"Written to {os.path.join(self.data_dir, METRICS_NAME)} every minute.")
+        else:
+            lines = ["Diagnostics are off. Start Tesseract with --diagnostics to time the",
+                     "tracking loop, saves and display refreshes."]
+        if not isinstance(self.tracker, UsageTracker):
+            try:
+                collector = self.tracker.diagnostics()
+            except (OSError, RuntimeError) as e:
+                collector = None
+                lines += ["", f"Collector unreachable: {e}"]
+            if collector:
+                lines += ["", "--- Collector ---"] + format_snapshot(collector)
+        self.diagnostics_text.config(state='normal')
+        self.diagnostics_text.delete('1.0', tk.END)
+        self.diagnostics_text.insert('1.0', "\n".join(lines))
+        self.diagnostics_text.config(state='disabled')
+        self.root.after(2000, self.refresh_diagnostics)
+
     # --- App Limit Functions ---
     def set_app_limit(self):
         app_name = self.app_name_entry.get().strip()
@@ -385,7 +693,8 @@ class TesseractApp:
             limit_minutes = int(time_limit)
             if limit_minutes <= 0:
                 raise ValueError("Must be positive")
-            self.app_limits[app_name] = limit_minutes
+            self.store.set_limit(app_name, limit_minutes, daily=self.daily_limit_var.get())
+            self.tracker.update_limits()
             self.save_data()
             messagebox.showinfo("Done!", f"Set {limit_minutes} minute limit for {app_name}")
             self.app_name_entry.delete(0, tk.END)
@@ -399,14 +708,31 @@ class TesseractApp:
         if not selection:
             messagebox.showwarning("No Selection", "Please select an app to remove")
             return
-        selected_text = self.limits_listbox.get(selection[0])
-        app_name = selected_text.split(' - ')[0]
+        app_name = self.limit_apps[selection[0]]
         if app_name in self.app_limits:
-            del self.app_limits[app_name]
+            self.store.remove_limit(app_name)
+            self.tracker.update_limits()
             self.save_data()
             self.update_limits_display()
             messagebox.showinfo("Removed", f"Removed limit for {app_name}")
 
+    def save_category_rules(self):
+        try:
+            rules = parse_rules(self.rules_text.get('1.0', tk.END))
+        except ValueError as e:
+            messagebox.showerror("Invalid Rule", str(e))
+            return
+        self.store.set_setting('category_rules', rules)
+        self.tracker.update_limits()
+        self.save_data()
+        self.update_limits_display()
+        messagebox.showinfo("Saved", f"Saved {len(rules)} category rules")
+
+    def toggle_title_tracking(self):
+        self.store.set_setting('title_tracking', self.title_tracking_var.get())
+        self.tracker.update_titles()
+        self.save_data()
+
     # --- Break Reminders ---
     def toggle_break_reminders(self):
         if not self.break_reminder_active:
@@ -414,6 +740,7 @@ class TesseractApp:
                 self.break_interval = int(self.break_interval_var.get())
                 if self.break_interval <= 0:
                     raise ValueError("Must be positive")
+                self.store.set_setting('break_interval', self.break_interval)
                 self.break_reminder_active = True
                 self.break_button.config(text="Stop Reminders", bg=self.colors['warning'])
                 self.start_break_reminders()
@@ -422,89 +749,213 @@ class TesseractApp:
                 messagebox.showerror("Invalid Input", "Please enter a valid number")
         else:
             self.break_reminder_active = False
+            self.timers.cancel(self.break_timer)
             self.break_button.config(text="Start Reminders", bg=self.colors['success'])
             messagebox.showinfo("Stopped", "Break reminders disabled")
 
     def start_break_reminders(self):
-        def reminder_loop():
-            while self.break_reminder_active:
-                time.sleep(self.break_interval * 60)
-                if self.break_reminder_active:
-                    self.root.after(0, lambda: messagebox.showinfo(
-                        "Break Time! 🌿", 
-                        f"You've been focused for {self.break_interval} minutes.\nTime to stretch and rest your eyes!"
-                    ))
-        self.break_thread = threading.Thread(target=reminder_loop, daemon=True)
-        self.break_thread.start()
+        seconds = self.break_interval * 60
+        if self.break_timer:
+            self.timers.reschedule(self.break_timer, seconds, interval=seconds)
+        else:
+            self.break_timer = self.timers.schedule(seconds, self.break_due, interval=seconds)
+
+    def on_break_interval_changed(self, *args):
+        # A new interval takes effect right away instead of after the current wait.
+        if not self.break_reminder_active:
+            return
+        try:
+            interval = int(self.break_interval_var.get())
+        except ValueError:
+            return
+        if interval > 0 and interval != self.break_interval:
+            self.break_interval = interval
+            self.store.set_setting('break_interval', interval)
+            self.start_break_reminders()
+
+    def break_due(self):
+        # Runs on the timer thread; the popup belongs on the Tk thread.
+        self.root.after(0, lambda: messagebox.showinfo(
+            "Break Time! 🌿",
+            f"You've been focused for {self.break_interval} minutes.\nTime to stretch and rest your eyes!"
+        ))
 
     # --- Data Management ---
     def export_data(self):
-        try:
-            data = {
-                'app_usage': dict(self.app_usage),
-                'daily_usage': dict(self.daily_usage),
-                'app_limits': self.app_limits,
-                'break_interval': self.break_interval
-            }
-            export_file = f"tesseract_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(export_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            messagebox.showinfo("Export Successful", f"Data exported to {export_file}")
-        except Exception as e:
-            messagebox.showerror("Export Failed", f"Couldn't export data:\n{e}")
+        if not isinstance(self.tracker, UsageTracker):
+            # A collector's history is exported where it runs (python -m transfer).
+            try:
+                data = self.store.export_state()
+                export_file = f"tesseract_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+                write_json_atomic(export_file, data, indent=2)
+                messagebox.showinfo("Export Successful", f"Data exported to {export_file}")
+            except Exception as e:
+                messagebox.showerror("Export Failed", f"Couldn't export data:\n{e}")
+            return
+        export_file = filedialog.asksaveasfilename(
+            initialfile=f"tesseract_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson.gz",
+            filetypes=EXPORT_FILETYPES)
+        if not export_file:
+            return
+
+        def export():
+            ledger = ImportLedger(os.path.join(self.data_dir, LEDGER_NAME))
+            try:
+                count = export_history(self.store, export_file, ledger=ledger)
+                self.root.after(0, lambda: messagebox.showinfo(
+                    "Export Successful", f"Exported {count} rows to {export_file}"))
+            except Exception as e:
+                self.root.after(0, lambda e=e: messagebox.showerror(
+                    "Export Failed", f"Couldn't export data:\n{e}"))
+            finally:
+                ledger.close()
+        threading.Thread(target=export, daemon=True).start()
+
+    def import_data(self):
+        if not isinstance(self.tracker, UsageTracker):
+            messagebox.showinfo("Import", "Import into the collector with python -m transfer import")
+            return
+        paths = filedialog.askopenfilenames(filetypes=EXPORT_FILETYPES)
+        if not paths:
+            return
+
+        def merge():
+            added = skipped = 0
+            ledger = ImportLedger(os.path.join(self.data_dir, LEDGER_NAME))
+            try:
+                for path in paths:
+                    stats = import_history(self.store, path, ledger, flush=self.tracker.writer.write_pending)
+                    added += stats['usage'] + stats['sessions'] + stats['limits']
+                    skipped += stats['skipped']
+                message = f"Merged {added} new rows ({skipped} were already here)"
+                self.root.after(0, lambda: self.finish_import(message))
+            except Exception as e:
+                self.root.after(0, lambda e=e: messagebox.showerror(
+                    "Import Failed", f"Couldn't import data:\n{e}"))
+            finally:
+                ledger.close()
+        threading.Thread(target=merge, daemon=True).start()
+
+    def finish_import(self, message):
+        self.tracker.reload()
+        self.tracker.update_limits()
+        if self.analytics:
+            self.analytics.reset()
+        self.update_limits_display()
+        messagebox.showinfo("Import Successful", message)
 
     def clear_data(self):
         if messagebox.askyesno("Are you sure?", "This will delete all your tracking data. This can't be undone!"):
-            self.app_usage.clear()
-            self.daily_usage.clear()
-            self.app_limits.clear()
-            self.save_data()
+            self.limit_usage.clear()
+            self.tracker.clear_data()
+            if isinstance(self.tracker, UsageTracker):
+                # A collector does this itself when it clears.
+                forget_imports(self.store, self.data_dir)
+            if self.analytics:
+                self.analytics.reset()
             messagebox.showinfo("Cleared", "All data has been cleared")
-            self.update_display()
 
     # --- Display Updates ---
-    def update_display(self):
+    def schedule_update(self, delay_ms):
+        # Called from the tracker thread; Tk marshals after() onto the main loop.
         try:
-            total_seconds = self.get_total_screen_time_today()
-            self.total_time_label.config(text=self.format_time(total_seconds))
-            progress_value = min((total_seconds / (8 * 3600)) * 100, 100)
-            self.time_progress['value'] = progress_value
-            if self.current_app and self.current_app != "Unknown":
-                display_name = self.current_app.replace('.exe', '').title()
-                self.current_app_label.config(text=f"Using {display_name}")
-            else:
-                self.current_app_label.config(text="Not tracking")
-            self.app_listbox.delete(0, tk.END)
-            sorted_apps = sorted(self.app_usage.items(), key=lambda x: x[1], reverse=True)
-            for i, (app, seconds) in enumerate(sorted_apps[:8]):
-                display_name = app.replace('.exe', '').title()
-                time_str = self.format_time(seconds)
-                self.app_listbox.insert(tk.END, f"{display_name} - {time_str}")
-                if seconds > 3600:
-                    self.app_listbox.itemconfig(i, bg=self.colors['warning'])
-                elif seconds > 1800:
-                    self.app_listbox.itemconfig(i, bg=self.colors['primary'])
-            self.update_limits_display()
+            self.root.after(delay_ms, self.update_display)
         except:
             pass
-        self.root.after(1000, self.update_display)
+
+    def update_display(self):
+        metrics = self.metrics
+        if metrics:
+            started = metrics.clock()
+        changes = self.changes.drain()
+        try:
+            if 'today_total' in changes:
+                if self.analytics:
+                    self.analytics.touch(datetime.now().strftime("%Y-%m-%d"))
+                total_seconds = changes['today_total']
+                self.total_time_label.config(text=self.format_time(total_seconds))
+                progress_value = min((total_seconds / (8 * 3600)) * 100, 100)
+                self.time_progress['value'] = progress_value
+            if 'current_app' in changes:
+                current_app = changes['current_app']
+                if current_app and current_app != "Unknown":
+                    display_name = current_app.replace('.exe', '').title()
+                    self.current_app_label.config(text=f"Using {display_name}")
+                else:
+                    self.current_app_label.config(text="Not tracking")
+            if 'top_apps' in changes:
+                self.update_top_apps(changes['top_apps'])
+            if 'limit_usage' in changes:
+                self.limit_usage.update(changes['limit_usage'])
+                self.update_limits_display()
+            for app_name, limit, daily in changes.get('limit_warnings', []):
+                self.show_limit_warning(app_name, limit, daily)
+        except Exception as e:
+            if metrics:
+                metrics.error('display', e)
+        if metrics:
+            metrics.observe('display', metrics.clock() - started)
+
+    def update_top_apps(self, top_apps):
+        rows = []
+        for app, seconds in top_apps:
+            display_name = app.replace('.exe', '').title()
+            time_str = self.format_time(seconds)
+            if seconds > 3600:
+                color = self.colors['warning']
+            elif seconds > 1800:
+                color = self.colors['primary']
+            else:
+                color = None
+            rows.append((f"{display_name} - {time_str}", color))
+        self.render_rows(self.app_listbox, rows)
 
     def update_limits_display(self):
+        if self.limits_listbox is None:
+            return
         try:
-            self.limits_listbox.delete(0, tk.END)
-            for app, limit in self.app_limits.items():
-                used_seconds = self.app_usage.get(app, 0)
-                used_minutes = int(used_seconds / 60)
+            rows = []
+            self.limit_apps = list(self.app_limits)
+            for app in self.limit_apps:
+                limit = self.app_limits[app]
+                used_minutes = int(self.limit_usage.get(app, 0) / 60)
                 status = "✅" if used_minutes <= limit else "⚠️"
                 display_name = app.replace('.exe', '').title()
-                self.limits_listbox.insert(tk.END, f"{display_name} - {limit}m limit ({used_minutes}m used) {status}")
-        except:
-            pass
+                period = "/day" if app in self.store.daily_limits else ""
+                rows.append((f"{display_name} - {limit}m{period} limit ({used_minutes}m used) {status}", None))
+            self.render_rows(self.limits_listbox, rows)
+        except Exception as e:
+            if self.metrics:
+                self.metrics.error('display', e)
+
+    def render_rows(self, listbox, rows):
+        # Only rows whose text or color band changed are touched, so a refresh
+        # costs at most a handful of Tk calls however much history there is.
+        previous = self.rendered_rows.get(listbox, [])
+        for i, (text, color) in enumerate(rows):
+            if i < len(previous):
+                if previous[i] == (text, color):
+                    continue
+                listbox.delete(i)
+            listbox.insert(i, text)
+            if color:
+                listbox.itemconfig(i, bg=color)
+        if len(previous) > len(rows):
+            listbox.delete(len(rows), tk.END)
+        self.rendered_rows[listbox] = rows
 
     def on_closing(self):
-        self.is_tracking = False
         self.break_reminder_active = False
-        self.save_data()
+        self.timers.stop()
+        try:
+            self.tracker.stop()
+        except:
+            pass
+        if self.metrics:
+            try:
+                self.metrics.dump(os.path.join(self.data_dir, METRICS_NAME))
+            except OSError:
+                pass
         self.root.destroy()
 
     def run(self):
@@ -512,14 +963,32 @@ class TesseractApp:
         self.root.mainloop()
 
 if __name__ == "__main__":
-    try:
-        import psutil
-        import win32gui
-        import win32process
-    except ImportError as e:
-        print(f"Missing required dependency: {e}")
-        print("\nInstall with: pip install psutil pywin32")
-        exit(1)
-    
-    app = TesseractApp()
+    parser = argparse.ArgumentParser(description="Tesseract screen time tracker")
+    parser.add_argument('--storage', choices=['log', 'sqlite'], default='log',
+                        help="usage store backend (default: log)")
+    parser.add_argument('--probe', choices=['win32', 'synthetic', 'replay'], default='win32',
+                        help="where foreground-window samples come from (default: win32)")
+    parser.add_argument('--trace', help="trace file to replay, or to record samples into")
+    parser.add_argument('--connect', metavar='ADDRESS',
+                        help="show a running collector (host:port or socket path) instead of tracking here")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print how long each startup phase took")
+    parser.add_argument('--diagnostics', action='store_true',
+                        help=f"time the tracking loop and UI, shown in the Diagnostics tab and written "
+                             f"to {METRICS_NAME} every minute")
+    args = parser.parse_args()
+
+    # With --connect the collector does the probing.
+    if args.probe == 'win32' and not args.connect:
+        missing = missing_dependencies()
+        if missing:
+            print(f"Missing required dependency: {', '.join(missing)}")
+            print("\nInstall with: pip install psutil pywin32")
+            exit(1)
+    elif args.probe == 'replay' and not args.trace and not args.connect:
+        parser.error("--probe replay needs --trace")
+
+    app = TesseractApp(storage=args.storage, probe=args.probe, trace=args.trace, connect=args.connect,
+                       profile=StartupProfile(args.profile_startup),
+                       metrics=Metrics() if args.diagnostics else None)
     app.run()
@@ -0,0 +1,331 @@
+"""Headless benchmarks of the tracker's hot paths on synthetic histories.
+
+Each scale generates a history of ``apps`` apps over ``days`` days with
+``switches`` focus switches per active hour, stored the way a real install
+holds it (retention already applied), then times:
+
+- load: ``load_data`` with the whole history, as the collector's first query
+  sees it; startup: ``load_data(lazy=True)``, as the window's first frame does
+- tick: one sample of the tracking loop, driven by a SyntheticProbe on a
+  simulated clock (mean and p99)
+- save: ``save_data`` plus the write of everything recorded since the last one
+- display: one full dashboard refresh through ``update_display``, with
+  stand-in widgets instead of a Tk mainloop
+- limits: re-evaluating every limit against the history (``resync``)
+
+Results are written as JSON; given a baseline from an earlier run, any
+metric that got slower than the tolerance allows is reported and the exit
+status is 1. ``--diagnostics`` runs with instrumentation on, to see what
+it costs. Run from src/::
+
+    python -m benchmark --scale small medium --output results.json
+    python -m benchmark --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from events import ChangeChannel
+from metrics import Metrics
+from probe import SyntheticProbe
+from retention import DEFAULT_RETENTION, retention_cutoffs
+from scheduler import SampleScheduler
+from storage import SNAPSHOT_NAME, SUMMARY_NAME, apply_record, empty_state, open_store, state_to_dict, \
+    summary_to_dict, write_json_atomic
+from tracker import UsageTracker
+
+SCALES = {
+    'small': {'apps': 20, 'days': 30, 'switches': 20},
+    'medium': {'apps': 200, 'days': 365, 'switches': 40},
+    'large': {'apps': 1000, 'days': 3 * 365, 'switches': 80},
+}
+ACTIVE_HOURS = (9, 17)
+LIMITED_APPS = 10
+
+
+class SimulatedClock:
+    """Wall and monotonic time that only move when the benchmark says so."""
+
+    def __init__(self, start):
+        self.start = start
+        self.elapsed = 0.0
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+
+    def now(self):
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def monotonic(self):
+        return self.elapsed
+
+
+class _Widget:
+    """Takes the Tk calls update_display makes and does nothing with them."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def config(self, **options):
+        self.calls += 1
+
+    def __setitem__(self, key, value):
+        self.calls += 1
+
+    def insert(self, index, text):
+        self.calls += 1
+
+    def delete(self, first, last=None):
+        self.calls += 1
+
+    def itemconfig(self, index, **options):
+        self.calls += 1
+
+
+def _history(apps, days, switches, start, seed=0):
+    """Yields (day, {app: seconds}, sessions) for each day before ``start``."""
+    rng = random.Random(seed)
+    names = [f"app{i:04d}.exe" for i in range(apps)]
+    weights = [1 / (rank + 1) ** 1.2 for rank in range(apps)]
+    midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    first, last = ACTIVE_HOURS
+    for offset in range(days, 0, -1):
+        day = midnight - timedelta(days=offset)
+        t = (day + timedelta(hours=first)).timestamp()
+        end = (day + timedelta(hours=last)).timestamp()
+        usage = defaultdict(float)
+        sessions = []
+        while t < end:
+            app = rng.choices(names, weights)[0]
+            length = min(rng.expovariate(switches / 3600), end - t)
+            usage[app] += length
+            sessions.append((app, t, t + length))
+            t += length
+        yield day.strftime("%Y-%m-%d"), usage, sessions
+
+
+def generate(kind, directory, scale, start, seed=0):
+    """Writes a synthetic history for ``scale`` into a store in ``directory``."""
+    session_cutoff, hourly_cutoff = retention_cutoffs(DEFAULT_RETENTION, start)
+    history = _history(scale['apps'], scale['days'], scale['switches'], start, seed)
+    if kind == 'log':
+        # Written straight as a compacted snapshot, which is what the log
+        # holds after running for a while.
+        state = empty_state()
+        for day, usage, sessions in history:
+            for app, seconds in usage.items():
+                state['usage'].add(day, app, seconds)
+            state['sessions'].extend(sessions)
+        apply_record(state, {'t': 'h', 's': session_cutoff, 'h': hourly_cutoff})
+        _set_limits(state['app_limits'], state['daily_limits'], state['usage'].top_apps(LIMITED_APPS))
+        os.makedirs(directory, exist_ok=True)
+        write_json_atomic(os.path.join(directory, SNAPSHOT_NAME), {'seq': 0, 'state': state_to_dict(state)})
+        write_json_atomic(os.path.join(directory, SUMMARY_NAME), {'seq': 0, 'state': summary_to_dict(state)})
+        return
+    store = open_store(kind, directory)
+    store.load()
+    for day, usage, sessions in history:
+        for app, seconds in usage.items():
+            store.add_usage(day, app, seconds)
+        store.add_sessions(sessions)
+        store.flush()
+    store.downsample(session_cutoff, hourly_cutoff)
+    limits, daily = {}, set()
+    _set_limits(limits, daily, store.top_apps(LIMITED_APPS))
+    for app, minutes in limits.items():
+        store.set_limit(app, minutes, daily=app in daily)
+    store.close()
+
+
+def _set_limits(limits, daily, top):
+    # Limits on the busiest apps, every other one daily, set low enough
+    # that some are crossed while ticking.
+    for rank, (app, seconds) in enumerate(top):
+        limits[app] = 30 + 15 * rank
+        if rank % 2 == 0:
+            daily.add(app)
+
+
+def _tracker(kind, directory, clock, apps, switches, seed=0, metrics=None):
+    store = open_store(kind, directory)
+    scheduler = SampleScheduler(monotonic=clock.monotonic)
+    probe = SyntheticProbe(app_count=apps, switch_probability=switches / 3600, seed=seed)
+    channel = ChangeChannel(lambda delay_ms: None)
+    return UsageTracker(store, probe, clock=clock.now, scheduler=scheduler, channel=channel, metrics=metrics)
+
+
+def _close(tracker, lazy=False):
+    if lazy:
+        tracker.store.history_loaded.wait()
+        deadline = time.monotonic() + 60
+        while tracker.loaded_sessions is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    tracker.timers.cancel(tracker.save_timer)
+    tracker.retention.stop()
+    tracker.writer.flush()
+    tracker.store.close()
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _view(tracker):
+    # A dashboard with stand-in widgets, so update_display runs as written.
+    from app import TesseractApp
+    view = TesseractApp.__new__(TesseractApp)
+    view.changes = tracker.channel
+    view.analytics = None
+    view.metrics = tracker.metrics
+    view.store = tracker.store
+    view.app_limits = tracker.store.app_limits
+    view.limit_usage = {}
+    view.limit_apps = []
+    view.rendered_rows = {}
+    view.colors = {'primary': 'primary', 'warning': 'warning'}
+    view.total_time_label = _Widget()
+    view.time_progress = _Widget()
+    view.current_app_label = _Widget()
+    view.app_listbox = _Widget()
+    view.limits_listbox = _Widget()
+    view.show_limit_warning = lambda app, limit, daily=True: None
+    return view
+
+
+def run_scale(kind, scale, ticks=2000, repeat=3, seed=0, diagnostics=False):
+    start = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    directory = tempfile.mkdtemp(prefix="tesseract-bench-")
+    try:
+        generate(kind, directory, scale, start, seed)
+        results = {}
+
+        loads, startups = [], []
+        for _ in range(repeat):
+            tracker = _tracker(kind, directory, SimulatedClock(start), scale['apps'], scale['switches'], seed)
+            began = time.perf_counter()
+            tracker.load_data()
+            loads.append(time.perf_counter() - began)
+            _close(tracker)
+            tracker = _tracker(kind, directory, SimulatedClock(start), scale['apps'], scale['switches'], seed)
+            began = time.perf_counter()
+            tracker.load_data(lazy=True)
+            startups.append(time.perf_counter() - began)
+            _close(tracker, lazy=True)
+        results['load'] = min(loads)
+        results['startup'] = min(startups)
+
+        clock = SimulatedClock(start)
+        metrics = Metrics() if diagnostics else None
+        tracker = _tracker(kind, directory, clock, scale['apps'], scale['switches'], seed, metrics)
+        tracker.load_data()
+        # Saves are timed on their own below, and retention already ran.
+        tracker.timers.cancel(tracker.save_timer)
+        tracker.retention.stop()
+        view = _view(tracker)
+
+        samples, saves = [], []
+        for i in range(ticks):
+            clock.advance(1.0)
+            began = time.perf_counter()
+            tracker.tick()
+            samples.append(time.perf_counter() - began)
+            if (i + 1) % tracker.save_interval == 0:
+                began = time.perf_counter()
+                tracker.save_data()
+                tracker.writer.write_pending()
+                saves.append(time.perf_counter() - began)
+        results['tick_mean'] = sum(samples) / len(samples)
+        results['tick_p99'] = _percentile(samples, 0.99)
+        results['save'] = sum(saves) / len(saves) if saves else 0.0
+
+        refreshes = []
+        for _ in range(200):
+            tracker.publish_all()
+            view.rendered_rows = {}
+            began = time.perf_counter()
+            view.update_display()
+            refreshes.append(time.perf_counter() - began)
+        results['display'] = sum(refreshes) / len(refreshes)
+
+        evaluations = []
+        for _ in range(200):
+            began = time.perf_counter()
+            tracker.limits.resync()
+            evaluations.append(time.perf_counter() - began)
+        results['limits'] = sum(evaluations) / len(evaluations)
+
+        _close(tracker)
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance=0.25, noise=0.0005):
+    """Returns (name, metric, baseline, current) for every metric that is
+    more than ``tolerance`` slower than the baseline, ignoring differences
+    smaller than ``noise`` seconds."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, current in metrics.items():
+            previous = baseline.get(name, {}).get(metric)
+            if previous is None:
+                continue
+            if current > previous * (1 + tolerance) and current - previous > noise:
+                regressions.append((name, metric, previous, current))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Tesseract on synthetic usage histories")
+    parser.add_argument('--scale', nargs='+', choices=sorted(SCALES), default=['small', 'medium'])
+    parser.add_argument('--storage', nargs='+', choices=['log', 'sqlite'], default=['log', 'sqlite'])
+    parser.add_argument('--ticks', type=int, default=2000, help="samples to time per scale (default: 2000)")
+    parser.add_argument('--repeat', type=int, default=3, help="loads to time, best one kept (default: 3)")
+    parser.add_argument('--diagnostics', action='store_true', help="run with instrumentation on")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="results JSON from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown before a metric counts as a regression (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for scale in args.scale:
+        for kind in args.storage:
+            name = f"{scale}/{kind}"
+            results[name] = run_scale(kind, SCALES[scale], ticks=args.ticks, repeat=args.repeat,
+                                      diagnostics=args.diagnostics)
+            print(name + "  " + "  ".join(f"{metric} {seconds * 1000:.3f}ms"
+                                          for metric, seconds in results[name].items()))
+
+    if args.output:
+        write_json_atomic(args.output, {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scales': {scale: SCALES[scale] for scale in args.scale},
+            'results': results,
+        }, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, previous, current in regressions:
+            print(f"REGRESSION {name} {metric}: {previous * 1000:.3f}ms -> {current * 1000:.3f}ms "
+                  f"({current / previous - 1:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+import fnmatch
+import re
+from collections import OrderedDict
+
+# Limits on a name starting with this are budgets for a whole category.
+CATEGORY_PREFIX = "@"
+RULE_KINDS = ('glob', 'regex', 'prefix')
+# \1 and friends; their numbers shift once the rules are combined.
+_NUMBERED_BACKREF = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]")
+
+
+def parse_rules(text):
+    """Parses one rule per line, ``Category: [title] kind pattern``, e.g.
+
+        Browsers: glob chrome.exe
+        Games: glob *game*
+        Video: title regex youtube|netflix
+
+    Blank lines and lines starting with # are skipped. Raises ValueError
+    naming the first bad line, including a regex that only fails once it
+    is compiled together with the rules before it (a backreference, or a
+    group name used twice).
+    """
+    rules = []
+    numbers = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        category, sep, rest = line.partition(':')
+        parts = rest.split(None, 1)
+        field = 'app'
+        if parts and parts[0] == 'title':
+            field = 'title'
+            parts = parts[1].split(None, 1) if len(parts) > 1 else []
+        if not sep or not category.strip() or len(parts) != 2 or parts[0] not in RULE_KINDS:
+            raise ValueError(f"line {number}: expected 'Category: [title] glob|regex|prefix pattern'")
+        kind, pattern = parts[0], parts[1].strip()
+        if kind == 'regex':
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"line {number}: {e}")
+            if _NUMBERED_BACKREF.search(pattern):
+                raise ValueError(f"line {number}: use a named group, (?P<name>...) and (?P=name), "
+                                 f"instead of a numbered backreference")
+        rules.append({'category': category.strip(), 'field': field, 'kind': kind, 'pattern': pattern})
+        numbers.append(number)
+    try:
+        Categorizer(rules)
+    except re.error:
+        # Find the first rule the combined patterns can't take.
+        for count in range(1, len(rules) + 1):
+            try:
+                Categorizer(rules[:count])
+            except re.error as e:
+                raise ValueError(f"line {numbers[count - 1]}: {e}")
+    return rules
+
+
+def format_rules(rules):
+    lines = []
+    for rule in rules:
+        field = "title " if rule.get('field') == 'title' else ""
+        lines.append(f"{rule['category']}: {field}{rule['kind']} {rule['pattern']}")
+    return "\n".join(lines)
+
+
+class _Matcher:
+    """All the rules for one field, compiled together; the earliest rule wins.
+
+    Literal globs are one dict lookup and prefixes one lookup per distinct
+    prefix length, however many of them there are. Wildcard globs and
+    regexes are a single alternation, one capturing group per rule, and
+    ``lastindex`` says which alternative matched.
+    """
+
+    def __init__(self, rules):
+        self.exact = {}
+        self.prefixes = {}
+        alternatives = []
+        self.group_rules = {}
+        group = 1
+        for index, rule in rules:
+            pattern = rule['pattern']
+            if rule['kind'] == 'prefix':
+                self.prefixes.setdefault(pattern.lower(), index)
+                continue
+            if rule['kind'] == 'glob':
+                if not any(char in pattern for char in '*?['):
+                    self.exact.setdefault(pattern.lower(), index)
+                    continue
+                regex = fnmatch.translate(pattern)
+            else:
+                regex = f".*?(?:{pattern})"
+            self.group_rules[group] = index
+            alternatives.append(f"({regex})")
+            group += 1 + re.compile(regex).groups
+        self.lengths = sorted({len(prefix) for prefix in self.prefixes})
+        self.combined = re.compile("|".join(alternatives), re.IGNORECASE | re.DOTALL) if alternatives else None
+
+    def match(self, name):
+        lowered = name.lower()
+        best = self.exact.get(lowered)
+        for length in self.lengths:
+            if length > len(lowered):
+                break
+            index = self.prefixes.get(lowered[:length])
+            if index is not None and (best is None or index < best):
+                best = index
+        if self.combined is not None:
+            found = self.combined.match(name)
+            if found:
+                index = self.group_rules[found.lastindex]
+                if best is None or index < best:
+                    best = index
+        return best
+
+
+class Categorizer:
+    """Maps an app, and optionally its window title, to a category.
+
+    Rules are tried in order and the first match wins; see _Matcher for how
+    they're compiled. Results are memoized per app, and per (app, title) in
+    an LRU of ``cache_size`` since titles keep changing, so a tick costs a
+    dict lookup no matter how many rules there are.
+    """
+
+    def __init__(self, rules=(), cache_size=4096):
+        self.rules = list(rules)
+        indexed = list(enumerate(self.rules))
+        self.apps = _Matcher([(i, rule) for i, rule in indexed if rule.get('field', 'app') == 'app'])
+        self.titles = _Matcher([(i, rule) for i, rule in indexed if rule.get('field') == 'title'])
+        self.has_titles = any(rule.get('field') == 'title' for rule in self.rules)
+        self.cache = {}
+        self.title_cache = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+
+    def category(self, app, title=None):
+        if title is None or not self.has_titles:
+            try:
+                category = self.cache[app]
+                self.hits += 1
+                return category
+            except KeyError:
+                self.misses += 1
+            index = self.apps.match(app)
+            category = self.cache[app] = None if index is None else self.rules[index]['category']
+            return category
+        key = (app, title)
+        try:
+            category = self.title_cache[key]
+            self.title_cache.move_to_end(key)
+            self.hits += 1
+            return category
+        except KeyError:
+            self.misses += 1
+        candidates = [index for index in (self.apps.match(app), self.titles.match(title)) if index is not None]
+        category = self.rules[min(candidates)]['category'] if candidates else None
+        self.title_cache[key] = category
+        if len(self.title_cache) > self.cache_size:
+            self.title_cache.popitem(last=False)
+        return category
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'rules': len(self.rules),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
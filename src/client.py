@@ -0,0 +1,193 @@
+import json
+import socket
+import threading
+
+from collector import DEFAULT_ADDRESS, parse_address
+
+
+class CollectorClient:
+    """Talks to a running collector over its line-delimited JSON API."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=10.0, token=None):
+        self.address = address
+        self.timeout = timeout
+        # Sent with every request; the collector needs it to change data.
+        self.token = token
+        self.sock = None
+        self.reader = None
+        self.stream = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        kind, target = parse_address(self.address)
+        sock = socket.socket(socket.AF_UNIX if kind == 'unix' else socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(target)
+        return sock
+
+    def call(self, op, **params):
+        with self.lock:
+            if self.sock is None:
+                self.sock = self.connect()
+                self.reader = self.sock.makefile('rb')
+            self.next_id += 1
+            params.update(op=op, id=self.next_id)
+            if self.token:
+                params['token'] = self.token
+            try:
+                self.sock.sendall(json.dumps(params).encode('utf-8') + b"\n")
+                line = self.reader.readline()
+            except OSError:
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise ConnectionError("collector closed the connection")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['result']
+
+    def subscribe(self, on_event, stopped=None):
+        """Blocks, passing each batch of changes to ``on_event`` until the
+        connection drops or ``stopped`` (an Event) is set."""
+        sock = self.stream = self.connect()
+        sock.settimeout(None)
+        try:
+            sock.sendall(json.dumps({'op': 'subscribe', 'token': self.token}).encode('utf-8') + b"\n")
+            for line in sock.makefile('rb'):
+                if stopped is not None and stopped.is_set():
+                    break
+                on_event(json.loads(line)['event'])
+        finally:
+            self.stream = None
+            sock.close()
+
+    def close(self):
+        for sock in (self.sock, self.stream):
+            if sock:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+        self.sock = self.reader = None
+
+
+class RemoteStore:
+    """The slice of the store API the dashboard uses, served by a collector.
+
+    Limits are mirrored locally so the dashboard can read them without a
+    round trip; edits go to the collector and update the mirror.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.app_limits = {}
+        self.daily_limits = set()
+        # The collector loads its own history; every query here sees all of it.
+        self.history_loaded = threading.Event()
+        self.history_loaded.set()
+
+    def refresh(self):
+        state = self.client.call('limits')
+        self.app_limits.clear()
+        self.app_limits.update(state['limits'])
+        self.daily_limits = set(state['daily'])
+
+    def get_setting(self, key, default=None):
+        return self.client.call('get_setting', key=key, default=default)
+
+    def set_setting(self, key, value):
+        self.client.call('set_setting', key=key, value=value)
+
+    def set_limit(self, app, minutes, daily=False):
+        self.client.call('set_limit', app=app, minutes=minutes, daily=daily)
+        self.app_limits[app] = minutes
+        if daily:
+            self.daily_limits.add(app)
+        else:
+            self.daily_limits.discard(app)
+
+    def remove_limit(self, app):
+        self.client.call('remove_limit', app=app)
+        self.app_limits.pop(app, None)
+        self.daily_limits.discard(app)
+
+    def top_apps(self, n, start_day=None, end_day=None):
+        return self.client.call('top_apps', n=n, start_day=start_day, end_day=end_day)
+
+    def usage_between(self, start_day, end_day, group_by='app', app=None):
+        return self.client.call('usage_between', start_day=start_day, end_day=end_day,
+                                group_by=group_by, app=app)
+
+    def title_usage(self, start_day, end_day, app=None):
+        return self.client.call('title_usage', start_day=start_day, end_day=end_day, app=app)
+
+    def export_state(self):
+        return self.client.call('export')
+
+    def close(self):
+        self.client.close()
+
+
+class RemoteTracker:
+    """Stands in for UsageTracker when the dashboard is a collector client.
+
+    ``track_usage`` follows the collector's change stream and republishes
+    it on the local channel, so the dashboard renders exactly as it does
+    when it runs the tracker itself.
+    """
+
+    def __init__(self, client, store, channel):
+        self.client = client
+        self.store = store
+        self.channel = channel
+        self.stopped = threading.Event()
+
+    def load_data(self, lazy=False):
+        self.store.refresh()
+
+    def save_data(self):
+        self.client.call('save')
+
+    def clear_data(self):
+        self.client.call('clear')
+
+    def update_limits(self):
+        # The collector re-arms its limits when they're edited through it.
+        pass
+
+    def update_titles(self):
+        # Likewise for the title settings.
+        pass
+
+    def diagnostics(self):
+        return self.client.call('metrics')
+
+    def publish_all(self):
+        try:
+            self.publish(self.client.call('snapshot'))
+        except OSError:
+            # Not up yet; the subscription sends a snapshot once it connects.
+            pass
+
+    def publish(self, changes):
+        if 'top_apps' in changes:
+            # A list would be appended to the pending batch, not replace it.
+            changes['top_apps'] = tuple(tuple(item) for item in changes['top_apps'])
+        self.channel.publish(changes)
+
+    def track_usage(self):
+        while not self.stopped.is_set():
+            try:
+                self.store.refresh()
+                self.client.subscribe(self.publish, self.stopped)
+            except (OSError, ValueError, RuntimeError):
+                pass
+            # Collector restarted or went away; try again shortly.
+            self.stopped.wait(2.0)
+
+    def stop(self):
+        self.stopped.set()
+        self.client.close()
@@ -0,0 +1,305 @@
+"""Headless collector: tracking, limits and persistence without Tk.
+
+Run from src/ with ``python -m collector``. The collector serves a
+line-delimited JSON API on localhost (or a Unix socket path) so the
+dashboard, scripts and other viewers can query and subscribe to it
+without touching the data files. One request per line::
+
+    {"id": 1, "op": "top_apps", "n": 5}
+    {"id": 1, "result": [["code.exe", 5400.0], ...]}
+
+Every request, ``subscribe`` included, must carry the install's token,
+read from ``collector.token`` in the data directory, as ``"token"``; the
+history and window titles are as private as the controls. A line that
+isn't a JSON object, or lacks the token, ends the connection, so nothing
+that merely reaches the port (a web page posting to localhost, another
+local user) gets a request through.
+
+``subscribe`` turns the connection into a stream: the current snapshot
+is sent first, then each coalesced batch of changes as ``{"event": {...}}``.
+"""
+import argparse
+import hmac
+import json
+import os
+import secrets
+import signal
+import socket
+import socketserver
+import threading
+
+from events import Broadcast, ChangeChannel
+from metrics import METRICS_NAME, Metrics
+from probe import ReplayProbe, make_probe
+from scheduler import SampleScheduler
+from storage import open_store
+from timers import TimerQueue
+from titles import check_title_setting
+from tracker import UsageTracker
+from transfer import forget_imports
+
+# A Unix socket in the data directory where the platform has them, since
+# only the user can open it; localhost TCP elsewhere.
+if hasattr(socket, 'AF_UNIX'):
+    DEFAULT_ADDRESS = os.path.join("tesseract_data", "collector.sock")
+else:
+    DEFAULT_ADDRESS = "127.0.0.1:47321"
+TOKEN_NAME = "collector.token"
+
+
+def parse_address(address):
+    """``host:port`` for TCP, anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return 'tcp', (host or "127.0.0.1", int(port))
+    return 'unix', address
+
+
+def load_token(data_dir, create=False):
+    """The install's API token, or None if there isn't one yet.
+
+    With ``create``, a missing token is generated and written to a file
+    only the current user can read.
+    """
+    path = os.path.join(data_dir, TOKEN_NAME)
+    try:
+        with open(path, 'r') as f:
+            token = f.read().strip()
+        if token or not create:
+            return token or None
+    except FileNotFoundError:
+        if not create:
+            return None
+    os.makedirs(data_dir, exist_ok=True)
+    token = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+
+class Collector:
+    def __init__(self, storage='log', probe='win32', trace=None,
+                 data_dir="tesseract_data", data_file="tesseract_data.json", frame_budget=0.5, metrics=None):
+        self.store = open_store(storage, data_dir, legacy_file=data_file)
+        self.data_dir = data_dir
+        self.token = load_token(data_dir, create=True)
+        self.metrics = metrics
+        self.hub = Broadcast()
+        self.frame_budget = frame_budget
+        window_probe = make_probe(probe, trace)
+        if isinstance(window_probe, ReplayProbe):
+            self.timers = TimerQueue(clock=window_probe.monotonic)
+            self.tracker = UsageTracker(self.store, window_probe, clock=window_probe.now,
+                                        scheduler=SampleScheduler(monotonic=window_probe.monotonic),
+                                        channel=self.hub, timers=self.timers, metrics=metrics)
+        else:
+            self.timers = TimerQueue()
+            self.tracker = UsageTracker(self.store, window_probe, channel=self.hub, timers=self.timers,
+                                        metrics=metrics)
+        self.server = None
+        self.socket_path = None
+        self.stopped = threading.Event()
+
+    # --- API ---
+    def authorized(self, request):
+        token = request.get('token')
+        return isinstance(token, str) and hmac.compare_digest(token, self.token)
+
+    def handle(self, request):
+        op = request.get('op')
+        store = self.store
+        if op == 'snapshot':
+            return self.tracker.snapshot()
+        if op == 'app_total':
+            return store.app_total(request['app'])
+        if op == 'day_total':
+            return store.day_total(request['day'])
+        if op == 'top_apps':
+            return store.top_apps(request.get('n', 8), request.get('start_day'), request.get('end_day'))
+        if op == 'usage_between':
+            return store.usage_between(request['start_day'], request['end_day'],
+                                       request.get('group_by', 'app'), request.get('app'))
+        if op == 'title_usage':
+            return store.title_usage(request['start_day'], request['end_day'], request.get('app'))
+        if op == 'sessions':
+            return store.sessions()
+        if op == 'limits':
+            return {'limits': store.app_limits, 'daily': sorted(store.daily_limits)}
+        if op == 'get_setting':
+            return store.get_setting(request['key'], request.get('default'))
+        if op == 'export':
+            return store.export_state()
+        if op == 'metrics':
+            return self.metrics.snapshot() if self.metrics else None
+        if op == 'set_limit':
+            store.set_limit(request['app'], int(request['minutes']), daily=bool(request.get('daily')))
+            self.tracker.update_limits()
+            self.tracker.save_data()
+            return True
+        if op == 'remove_limit':
+            store.remove_limit(request['app'])
+            self.tracker.update_limits()
+            self.tracker.save_data()
+            return True
+        if op == 'set_setting':
+            store.set_setting(request['key'], check_title_setting(request['key'], request['value']))
+            if request['key'] == 'category_rules':
+                self.tracker.update_limits()
+            elif request['key'].startswith('title_'):
+                self.tracker.update_titles()
+            self.tracker.save_data()
+            return True
+        if op == 'save':
+            self.tracker.save_data()
+            return True
+        if op == 'clear':
+            self.tracker.clear_data()
+            forget_imports(store, self.data_dir)
+            return True
+        raise ValueError(f"unknown op: {op!r}")
+
+    def subscribe(self, send):
+        """Streams changes through ``send(message)`` until it fails or we stop."""
+        wake = threading.Event()
+        delay = [0]
+
+        def wakeup(delay_ms):
+            delay[0] = delay_ms
+            wake.set()
+
+        channel = ChangeChannel(wakeup, frame_budget=self.frame_budget)
+        self.hub.add(channel)
+        try:
+            send({'event': self.tracker.snapshot()})
+            while not self.stopped.is_set():
+                if not wake.wait(1.0):
+                    continue
+                wake.clear()
+                if delay[0] and self.stopped.wait(delay[0] / 1000):
+                    break
+                send({'event': channel.drain()})
+        finally:
+            self.hub.remove(channel)
+
+    # --- Lifecycle ---
+    def serve(self, address=DEFAULT_ADDRESS):
+        kind, bind = parse_address(address)
+        if kind == 'unix':
+            if os.path.exists(bind):
+                os.unlink(bind)
+            self.socket_path = bind
+            os.makedirs(os.path.dirname(os.path.abspath(bind)), exist_ok=True)
+            self.server = socketserver.ThreadingUnixStreamServer(bind, RequestHandler)
+            os.chmod(bind, 0o600)
+        else:
+            self.server = socketserver.ThreadingTCPServer(bind, RequestHandler)
+        self.server.daemon_threads = True
+        self.server.collector = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address
+
+    def run(self, address=DEFAULT_ADDRESS):
+        self.tracker.load_data(lazy=True)
+        if self.metrics:
+            self.metrics.start_dump(self.timers, os.path.join(self.data_dir, METRICS_NAME))
+        self.serve(address)
+        self.timers.start()
+        self.tracker.track_usage()
+
+    def stop(self):
+        self.stopped.set()
+        self.timers.stop()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            if self.socket_path:
+                try:
+                    os.unlink(self.socket_path)
+                except OSError:
+                    pass
+        self.tracker.stop()
+        if self.metrics:
+            try:
+                self.metrics.dump(os.path.join(self.data_dir, METRICS_NAME))
+            except OSError:
+                pass
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        collector = self.server.collector
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                # Not a client of ours (an HTTP request, say); don't read on.
+                try:
+                    self.send({'error': "invalid JSON"})
+                except OSError:
+                    pass
+                return
+            if not collector.authorized(request):
+                try:
+                    self.send({'id': request.get('id'), 'error': f"PermissionError: needs the token from {TOKEN_NAME}"})
+                except OSError:
+                    pass
+                return
+            if request.get('op') == 'subscribe':
+                try:
+                    collector.subscribe(self.send)
+                except OSError:
+                    pass
+                return
+            reply = {'id': request.get('id')}
+            try:
+                reply['result'] = collector.handle(request)
+            except Exception as e:
+                reply['error'] = f"{type(e).__name__}: {e}"
+            try:
+                self.send(reply)
+            except OSError:
+                return
+
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode('utf-8') + b"\n")
+        self.wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tesseract headless collector")
+    parser.add_argument('--storage', choices=['log', 'sqlite'], default='log',
+                        help="usage store backend (default: log)")
+    parser.add_argument('--probe', choices=['win32', 'synthetic', 'replay'], default='win32',
+                        help="where foreground-window samples come from (default: win32)")
+    parser.add_argument('--trace', help="trace file to replay, or to record samples into")
+    parser.add_argument('--listen', default=DEFAULT_ADDRESS,
+                        help=f"host:port or Unix socket path to serve on (default: {DEFAULT_ADDRESS})")
+    parser.add_argument('--diagnostics', action='store_true',
+                        help=f"time the tracking loop and saves; see the metrics op and {METRICS_NAME}")
+    args = parser.parse_args(argv)
+    if args.probe == 'replay' and not args.trace:
+        parser.error("--probe replay needs --trace")
+
+    try:
+        collector = Collector(storage=args.storage, probe=args.probe, trace=args.trace,
+                              metrics=Metrics() if args.diagnostics else None)
+    except RuntimeError as e:
+        print(e)
+        return 1
+
+    def shutdown(signum, frame):
+        collector.tracker.is_tracking = False
+        collector.tracker.scheduler.stop()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    collector.run(args.listen)
+    collector.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,71 @@
+import threading
+import time
+
+
+class ChangeChannel:
+    """Hands tracker changes to the UI thread, coalesced per frame.
+
+    ``publish`` may be called from any thread. Changes are merged into one
+    pending batch (latest value wins, dicts are merged, lists appended) and
+    the UI is woken at most once per ``frame_budget`` seconds through the
+    ``wakeup(delay_ms)`` callback; it then takes the batch with ``drain``.
+    Nothing is scheduled while nothing changes.
+    """
+
+    def __init__(self, wakeup, frame_budget=0.5, clock=time.monotonic):
+        self.wakeup = wakeup
+        self.frame_budget = frame_budget
+        self.clock = clock
+        self.pending = {}
+        self.scheduled = False
+        self.last_delivery = None
+        self.lock = threading.Lock()
+
+    def publish(self, changes):
+        with self.lock:
+            for key, value in changes.items():
+                if isinstance(value, dict):
+                    self.pending.setdefault(key, {}).update(value)
+                elif isinstance(value, list):
+                    self.pending.setdefault(key, []).extend(value)
+                else:
+                    self.pending[key] = value
+            if self.scheduled or not self.pending:
+                return
+            self.scheduled = True
+            if self.last_delivery is None:
+                delay = 0
+            else:
+                delay = max(0.0, self.last_delivery + self.frame_budget - self.clock())
+        self.wakeup(int(delay * 1000))
+
+    def drain(self):
+        with self.lock:
+            changes, self.pending = self.pending, {}
+            self.scheduled = False
+            self.last_delivery = self.clock()
+            return changes
+
+
+class Broadcast:
+    """Fans published changes out to any number of ChangeChannels.
+
+    Each subscriber gets its own channel, so a slow viewer only coalesces
+    its own backlog and never holds up the tracker or the others.
+    """
+
+    def __init__(self):
+        self.channels = []
+        self.lock = threading.Lock()
+
+    def add(self, channel):
+        with self.lock:
+            self.channels = self.channels + [channel]
+
+    def remove(self, channel):
+        with self.lock:
+            self.channels = [c for c in self.channels if c is not channel]
+
+    def publish(self, changes):
+        for channel in self.channels:
+            channel.publish(changes)
@@ -0,0 +1,100 @@
+import threading
+from datetime import datetime, timedelta
+
+
+class LimitEngine:
+    """Fires limit warnings from timers set at precomputed thresholds.
+
+    Each limited app's next threshold is the limit itself, then every
+    ``repeat_minutes`` after it. Only the focused app accumulates time, so
+    on a focus change the engine looks up that app's usage once and arms a
+    repeating timer for the moment its next threshold is crossed. Sampling
+    ticks don't touch the engine at all, and no crossing can fall between
+    two samples. A daily limit also gets a timer at local midnight, when its
+    counter starts over.
+
+    ``usage_of(app, since)`` returns the seconds used since a timestamp, or
+    in total when ``since`` is None. Call ``resync`` after a tracking gap
+    (sleep/resume) so the deadline is recomputed from what was recorded.
+    """
+
+    def __init__(self, usage_of, on_crossing, timers, clock=datetime.now, repeat_minutes=5):
+        self.usage_of = usage_of
+        self.on_crossing = on_crossing
+        self.timers = timers
+        self.clock = clock
+        self.repeat = repeat_minutes * 60
+        self.limits = {}
+        self.daily = set()
+        self.used = {}
+        self.focused = None
+        self.focused_at = None
+        self.crossing_timer = None
+        self.midnight_timer = None
+        self.lock = threading.Lock()
+
+    def set_limits(self, limits, daily):
+        with self.lock:
+            self.limits = dict(limits)
+            self.daily = set(daily)
+            self.used = {}
+            self._refocus(self.focused)
+
+    def focus(self, app):
+        with self.lock:
+            if app != self.focused:
+                self._refocus(app)
+
+    def resync(self):
+        with self.lock:
+            self.used = {}
+            self._refocus(self.focused)
+
+    def _refocus(self, app):
+        # The app losing focus may still be credited for the last sample,
+        # so it's looked up again next time rather than extrapolated.
+        self.used.pop(self.focused, None)
+        self.timers.cancel(self.crossing_timer)
+        self.timers.cancel(self.midnight_timer)
+        self.crossing_timer = self.midnight_timer = None
+        self.focused = app
+        if app not in self.limits:
+            return
+        now = self.clock()
+        used = self._lookup(app, now)
+        self.focused_at = self.timers.clock()
+        limit = self.limits[app] * 60
+        if used < limit:
+            threshold = limit
+        else:
+            # Already over: the next warning is the next repeat, not right now.
+            threshold = limit + self.repeat * (int((used - limit) // self.repeat) + 1)
+        self.crossing_timer = self.timers.schedule(threshold - used, self._crossed, interval=self.repeat)
+        if app in self.daily:
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            self.midnight_timer = self.timers.schedule((midnight - now).total_seconds(), self.resync)
+
+    def _lookup(self, app, now):
+        since = None
+        if app in self.daily:
+            since = datetime.combine(now.date(), datetime.min.time()).timestamp()
+        used = self.used[app] = self.usage_of(app, since)
+        return used
+
+    def _crossed(self):
+        with self.lock:
+            app = self.focused
+            if app not in self.limits:
+                return
+            crossing = (app, self.limits[app], app in self.daily)
+        self.on_crossing(*crossing)
+
+    def usage(self, app):
+        with self.lock:
+            if app not in self.limits:
+                return 0
+            if app not in self.used:
+                return self._lookup(app, self.clock())
+            if app == self.focused:
+                return self.used[app] + self.timers.clock() - self.focused_at
+            return self.used[app]
@@ -0,0 +1,138 @@
+import bisect
+import os
+import threading
+import time
+from datetime import datetime
+
+from storage import write_json_atomic
+
+# Histogram bucket upper bounds in seconds, from 50µs to 10s.
+LATENCY_BOUNDS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                  0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_NAME = "metrics.json"
+
+
+class Histogram:
+    """Counts of observed durations per fixed bucket, plus count/sum/max."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket the quantile falls in, capped at the
+        # largest value seen.
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return 0.0
+
+    def snapshot(self):
+        labels = [f"<={bound * 1000:g}ms" for bound in self.bounds] + [f">{self.bounds[-1] * 1000:g}ms"]
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class Metrics:
+    """Hot-path timings, counters and swallowed errors, for diagnostics.
+
+    Components take ``metrics=None`` and check it before measuring anything,
+    so with diagnostics off the only cost is that one test. ``add_source``
+    registers a component's own ``stats()`` (cache hit rates, writer and
+    scheduler state), which is only called when a snapshot is taken.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = datetime.now()
+        self.histograms = {}
+        self.counters = {}
+        self.last_errors = {}
+        self.sources = {}
+        self.dump_timer = None
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def error(self, where, error):
+        # An exception a loop caught and carried on from.
+        with self.lock:
+            key = f"errors.{where}"
+            self.counters[key] = self.counters.get(key, 0) + 1
+            self.last_errors[where] = f"{type(error).__name__}: {error}"
+
+    def add_source(self, name, stats):
+        self.sources[name] = stats
+
+    def snapshot(self):
+        with self.lock:
+            data = {
+                'started': self.started.isoformat(timespec='seconds'),
+                'taken': datetime.now().isoformat(timespec='seconds'),
+                'timings': {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+                'counters': dict(self.counters),
+                'last_errors': dict(self.last_errors),
+            }
+        for name, stats in list(self.sources.items()):
+            try:
+                data[name] = stats()
+            except Exception as e:
+                data[name] = {'error': f"{type(e).__name__}: {e}"}
+        return data
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        write_json_atomic(path, self.snapshot(), indent=2)
+
+    def start_dump(self, timers, path, interval=60):
+        """Rewrites ``path`` with a snapshot every ``interval`` seconds."""
+        self.dump_timer = timers.schedule(interval, lambda: self.dump(path), interval=interval)
+
+
+def format_snapshot(data):
+    """A snapshot as plain text lines, for the Diagnostics tab."""
+    lines = []
+    for name, timing in sorted(data.get('timings', {}).items()):
+        lines.append(f"{name:<12} n={timing['count']:<8} mean {timing['mean'] * 1000:.3f}ms  "
+                     f"p50 {timing['p50'] * 1000:.3g}ms  p99 {timing['p99'] * 1000:.3g}ms  "
+                     f"max {timing['max'] * 1000:.3f}ms")
+    counters = data.get('counters', {})
+    if counters:
+        lines.append("")
+        lines.extend(f"{name:<24} {value}" for name, value in sorted(counters.items()))
+    for where, message in sorted(data.get('last_errors', {}).items()):
+        lines.append(f"last {where} error: {message}")
+    for name, stats in data.items():
+        if isinstance(stats, dict) and name not in ('timings', 'counters', 'last_errors'):
+            values = "  ".join(f"{key} {value:.3g}" if isinstance(value, float) else f"{key} {value}"
+                               for key, value in stats.items())
+            lines.append("")
+            lines.append(f"{name}: {values}")
+    return lines
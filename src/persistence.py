@@ -0,0 +1,101 @@
+import threading
+import time
+
+
+class PersistenceWorker:
+    """Writes store batches on a dedicated thread.
+
+    ``request_save`` only sets a flag, so it's safe to call from the
+    tracker or the Tk thread without waiting on the disk. The worker waits
+    ``debounce`` seconds after the first request so a burst of requests
+    becomes one write. It takes the store's pending batch, which nobody
+    mutates once taken, and writes it. A batch that fails to write is kept
+    and retried first next time, so the data isn't lost. ``flush`` stops
+    the thread and writes whatever is left on the calling thread; use it
+    on exit.
+    """
+
+    def __init__(self, store, debounce=1.0, metrics=None):
+        self.store = store
+        self.debounce = debounce
+        self.metrics = metrics
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.retry = None
+        self.write_lock = threading.Lock()
+
+        self.requests = 0
+        self.saves = 0
+        self.failures = 0
+        self.records_written = 0
+        self.bytes_written = 0
+        self.last_duration = 0.0
+        self.last_error = None
+
+    def start(self):
+        if not self.thread or not self.thread.is_alive():
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def request_save(self):
+        self.requests += 1
+        self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            if self.stopping.wait(self.debounce):
+                break
+            self.wake.clear()
+            self.write_pending()
+
+    def write_pending(self):
+        with self.write_lock:
+            # Older data goes first; newer data stays pending in the store
+            # until a failed batch has made it to disk.
+            if self.retry and not self.write_batch(self.retry):
+                return False
+            self.retry = None
+            batch = self.store.take_pending()
+            return not batch or self.write_batch(batch)
+
+    def write_batch(self, batch):
+        started = time.perf_counter()
+        written = getattr(self.store, 'bytes_written', 0)
+        try:
+            self.records_written += self.store.write_batch(batch)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            self.retry = batch
+            if self.metrics:
+                self.metrics.error('save', e)
+            return False
+        finally:
+            self.last_duration = time.perf_counter() - started
+            if self.metrics:
+                self.metrics.observe('save', self.last_duration)
+        self.bytes_written += getattr(self.store, 'bytes_written', 0) - written
+        self.saves += 1
+        return True
+
+    def flush(self, timeout=5.0):
+        self.stopping.set()
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout)
+        return self.write_pending()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'saves': self.saves,
+            'failures': self.failures,
+            'records_written': self.records_written,
+            'bytes_written': self.bytes_written,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+            'retry_pending': self.retry is not None,
+        }
@@ -0,0 +1,247 @@
+import json
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import win32api
+    import win32gui
+    import win32process
+except ImportError:
+    win32api = win32gui = win32process = None
+
+
+def missing_dependencies():
+    """Names of the packages Win32Probe needs that aren't installed."""
+    return [name for name, module in (('psutil', psutil), ('pywin32', win32gui)) if module is None]
+
+
+class ProcessNameCache:
+    """LRU cache of process names keyed by (hwnd, pid).
+
+    While the foreground window stays the same, ``resolve`` answers from the
+    last entry without touching psutil at all. A switch back to a window seen
+    before costs one create-time lookup, which also catches a PID that has
+    been reused by a different process since it was cached.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.last_key = None
+        self.last_name = None
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, hwnd, pid):
+        key = (hwnd, pid)
+        if key == self.last_key:
+            self.hits += 1
+            return self.last_name
+        process = psutil.Process(pid)
+        create_time = process.create_time()
+        cached = self.entries.get(key)
+        if cached and cached[0] == create_time:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            name = cached[1]
+        else:
+            self.misses += 1
+            name = process.name()
+            self.entries[key] = (create_time, name)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        self.last_key = key
+        self.last_name = name
+        return name
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.entries),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class WindowProbe:
+    """Tells the tracker which app is in the foreground right now.
+
+    With ``titles`` set, ``get_active_window`` also leaves that window's
+    title in ``title``; it's off by default so titles are never read
+    unless the user asked for them.
+    """
+
+    titles = False
+    title = ""
+
+    def get_active_window(self):
+        raise NotImplementedError
+
+    def idle_seconds(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class Win32Probe(WindowProbe):
+    def __init__(self, cache_size=256):
+        if missing_dependencies():
+            raise RuntimeError("Win32Probe needs psutil and pywin32")
+        self.name_cache = ProcessNameCache(cache_size)
+
+    def get_active_window(self):
+        try:
+            hwnd = win32gui.GetForegroundWindow()
+            if hwnd:
+                _, pid = win32process.GetWindowThreadProcessId(hwnd)
+                if self.titles:
+                    self.title = win32gui.GetWindowText(hwnd)
+                return self.name_cache.resolve(hwnd, pid)
+        except:
+            pass
+        self.title = ""
+        return "Unknown"
+
+    def idle_seconds(self):
+        try:
+            return (win32api.GetTickCount() - win32api.GetLastInputInfo()) / 1000
+        except:
+            return 0
+
+
+class SyntheticProbe(WindowProbe):
+    """Generates an app-switch workload without touching the OS.
+
+    Each call is one sample: with ``switch_probability`` focus moves to
+    another of ``app_count`` apps, picked with a Zipf-like ``skew`` so a
+    handful of apps dominate the way they do on a real desktop. With
+    ``titles`` on, each switch also picks one of ``title_count`` titles
+    with the same skew, or with ``unique_titles`` probability a title
+    never seen before, like a browser wandering across pages.
+    """
+
+    def __init__(self, app_count=20, switch_probability=0.05, skew=1.2, seed=0,
+                 title_count=50, unique_titles=0.1):
+        self.apps = [f"app{i:04d}.exe" for i in range(app_count)]
+        self.weights = [1 / (rank + 1) ** skew for rank in range(app_count)]
+        self.switch_probability = switch_probability
+        self.random = random.Random(seed)
+        self.current = self.apps[0]
+        self.title_names = [f"Document {i}" for i in range(title_count)]
+        self.title_weights = [1 / (rank + 1) ** skew for rank in range(title_count)]
+        self.unique_titles = unique_titles
+        self.unique = 0
+
+    def get_active_window(self):
+        if self.random.random() < self.switch_probability:
+            self.current = self.random.choices(self.apps, self.weights)[0]
+            if self.titles:
+                if self.random.random() < self.unique_titles:
+                    self.unique += 1
+                    self.title = f"({self.unique % 9 + 1}) Page {self.unique:x} - {self.current}"
+                else:
+                    self.title = self.random.choices(self.title_names, self.title_weights)[0] + f" - {self.current}"
+        return self.current
+
+
+class ReplayProbe(WindowProbe):
+    """Feeds back a trace written by TraceRecorder, one sample per call.
+
+    ``now()`` returns the recorded timestamp of the current sample, so a
+    tracker driven with it as its clock reproduces the recording exactly,
+    independent of how fast it is replayed.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'r')
+        self.timestamp = None
+        self.idle = 0
+        self.exhausted = False
+
+    def get_active_window(self):
+        line = self.file.readline()
+        if not line:
+            self.exhausted = True
+            return "Unknown"
+        sample = json.loads(line)
+        self.timestamp = sample['t']
+        # The scheduler stretches its interval while idle; without the
+        # recorded idle time those longer steps would be replayed as gaps.
+        self.idle = sample.get('idle', 0)
+        self.title = sample.get('title', "")
+        return sample['app']
+
+    def idle_seconds(self):
+        return self.idle
+
+    def now(self):
+        if self.timestamp is None:
+            return datetime.now()
+        return datetime.fromtimestamp(self.timestamp)
+
+    def monotonic(self):
+        return self.timestamp if self.timestamp is not None else time.time()
+
+    def close(self):
+        self.file.close()
+
+
+class TraceRecorder(WindowProbe):
+    """Wraps another probe and writes every sample it returns to a trace file."""
+
+    def __init__(self, probe, path):
+        self.probe = probe
+        self.file = open(path, 'a')
+        self.idle = 0
+
+    @property
+    def titles(self):
+        return self.probe.titles
+
+    @titles.setter
+    def titles(self, enabled):
+        self.probe.titles = enabled
+
+    @property
+    def title(self):
+        return self.probe.title
+
+    def idle_seconds(self):
+        # Read with the sample, so the trace has what the tracker saw.
+        return self.idle
+
+    def get_active_window(self):
+        app = self.probe.get_active_window()
+        self.idle = self.probe.idle_seconds()
+        sample = {'t': time.time(), 'app': app}
+        if self.idle:
+            sample['idle'] = self.idle
+        if self.probe.titles:
+            sample['title'] = self.probe.title
+        self.file.write(json.dumps(sample) + '\n')
+        return app
+
+    def close(self):
+        self.probe.close()
+        self.file.close()
+
+
+def make_probe(kind, trace=None):
+    if kind == 'synthetic':
+        probe = SyntheticProbe()
+    elif kind == 'replay':
+        return ReplayProbe(trace)
+    else:
+        probe = Win32Probe()
+    if trace:
+        probe = TraceRecorder(probe, trace)
+    return probe
@@ -0,0 +1,56 @@
+import threading
+
+
+class TopN:
+    """The ``n`` largest app totals, maintained as usage accumulates.
+
+    Totals only ever grow, so every app outside the set is at or below the
+    smallest one inside it. An outside app therefore only needs looking at
+    when it gains time, and it enters by displacing that smallest entry;
+    no update ever has to look at the full history.
+    """
+
+    def __init__(self, n, total_of):
+        self.n = n
+        self.total_of = total_of
+        self.totals = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def seed(self, items):
+        with self.lock:
+            self.totals = dict(items[:self.n])
+            self.version += 1
+
+    def clear(self):
+        self.seed([])
+
+    def add(self, app, seconds):
+        with self.lock:
+            if app in self.totals:
+                self.hits += 1
+                self.totals[app] += seconds
+            else:
+                self.misses += 1
+                total = self.total_of(app)
+                if len(self.totals) >= self.n:
+                    smallest = min(self.totals, key=self.totals.get)
+                    if total <= self.totals[smallest]:
+                        return
+                    del self.totals[smallest]
+                self.totals[app] = total
+            self.version += 1
+
+    def items(self):
+        with self.lock:
+            return sorted(self.totals.items(), key=lambda x: x[1], reverse=True)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
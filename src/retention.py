@@ -0,0 +1,65 @@
+import threading
+from datetime import datetime, timedelta
+
+DEFAULT_RETENTION = {'session_days': 30, 'hourly_days': 365}
+
+
+def retention_cutoffs(retention, now):
+    """Timestamps (local midnight) before which sessions become hourly
+    buckets, and before which hourly buckets are dropped."""
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    session_days = retention.get('session_days', DEFAULT_RETENTION['session_days'])
+    hourly_days = max(retention.get('hourly_days', DEFAULT_RETENTION['hourly_days']), session_days)
+    return ((midnight - timedelta(days=session_days)).timestamp(),
+            (midnight - timedelta(days=hourly_days)).timestamp())
+
+
+class RetentionJob:
+    """Downsamples old history every ``interval`` seconds.
+
+    Raw sessions are kept for ``session_days``, then rolled into hourly
+    per-app buckets, which are kept for ``hourly_days``, as is per-title
+    time. Per-day per-app totals are never dropped, so every total stays
+    exact; only how finely old time can be split is lost. The policy is the store's
+    ``retention`` setting. The work runs on a thread of its own so a large
+    first pass doesn't stall the timer queue. ``on_downsample(cutoff)`` is
+    called after each pass, so views of the sessions can let go of what is
+    now in hourly buckets.
+    """
+
+    def __init__(self, store, timers, clock=datetime.now, interval=6 * 3600, on_downsample=None):
+        self.store = store
+        self.timers = timers
+        self.clock = clock
+        self.interval = interval
+        self.on_downsample = on_downsample
+        self.timer = None
+        self.thread = None
+        # One pass at a time, whichever thread asks.
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.timer = self.timers.schedule(0, self.run_async, interval=self.interval)
+
+    def stop(self):
+        self.timers.cancel(self.timer)
+        self.timer = None
+        if self.thread:
+            self.thread.join()
+
+    def run_async(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        retention = self.store.get_setting('retention') or DEFAULT_RETENTION
+        session_cutoff, hourly_cutoff = retention_cutoffs(retention, self.clock())
+        with self.lock:
+            if session_cutoff <= self.store.session_floor:
+                return False
+            self.store.downsample(session_cutoff, hourly_cutoff)
+        if self.on_downsample:
+            self.on_downsample(session_cutoff)
+        return True
@@ -0,0 +1,89 @@
+import threading
+import time
+
+
+class SampleScheduler:
+    """Deadline-based, adaptive sampling cadence for the tracker.
+
+    Deadlines advance by the current interval from the previous deadline,
+    not from whenever the last sample finished, so the cadence doesn't drift
+    with probe and save latency. The interval drops to ``min_interval``
+    right after a focus switch, grows by ``backoff`` while focus is stable,
+    and parks at ``idle_interval`` while there is no user input.
+
+    ``mark`` measures the time since the previous sample on the monotonic
+    clock and reports a gap (returns None) when the process was suspended,
+    the machine slept, or the loop stalled for longer than the tolerance,
+    so such time is never credited to whatever app happened to be focused.
+    """
+
+    def __init__(self, min_interval=0.5, max_interval=5.0, idle_interval=15.0,
+                 backoff=1.5, idle_after=300, gap_tolerance=5.0, monotonic=time.monotonic):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_interval = idle_interval
+        self.backoff = backoff
+        self.idle_after = idle_after
+        self.gap_tolerance = gap_tolerance
+        self.monotonic = monotonic
+
+        self.interval = min_interval
+        self.expected = min_interval
+        self.deadline = None
+        self.last_mono = None
+        self.last_wall = None
+        self.stopped = threading.Event()
+
+        self.wakeups = 0
+        self.overruns = 0
+        self.gaps = 0
+
+    def mark(self, wall_now):
+        mono_now = self.monotonic()
+        last_mono, last_wall = self.last_mono, self.last_wall
+        self.last_mono, self.last_wall = mono_now, wall_now
+        if last_mono is None:
+            return None
+        elapsed = mono_now - last_mono
+        # A monotonic clock that stops during suspend (Linux) shows up as wall
+        # time running ahead; one that doesn't (Windows) as a long elapsed.
+        skew = (wall_now - last_wall).total_seconds() - elapsed
+        if elapsed > self.expected + self.gap_tolerance or abs(skew) > self.gap_tolerance:
+            self.gaps += 1
+            self.deadline = None
+            return None
+        return elapsed
+
+    def adapt(self, switched, idle_seconds=0):
+        if idle_seconds and idle_seconds >= self.idle_after:
+            self.interval = self.idle_interval
+        elif switched:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        self.expected = self.interval
+
+    def wait(self):
+        now = self.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+        self.deadline += self.interval
+        if self.deadline < now:
+            # Fell more than a whole interval behind; skip the missed ticks
+            # instead of firing them back to back.
+            self.overruns += 1
+            self.deadline = now + self.interval
+        self.expected = self.deadline - (self.last_mono if self.last_mono is not None else now)
+        self.wakeups += 1
+        return not self.stopped.wait(self.deadline - now)
+
+    def stop(self):
+        self.stopped.set()
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'wakeups': self.wakeups,
+            'overruns': self.overruns,
+            'gaps': self.gaps,
+        }
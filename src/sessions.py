@@ -0,0 +1,151 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class _Intervals:
+    """Sorted, non-overlapping intervals with a running prefix sum of durations."""
+
+    __slots__ = ('starts', 'ends', 'cumulative')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.cumulative = [0.0]
+
+    def append(self, start, end):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.cumulative.append(self.cumulative[-1] + end - start)
+
+    def extend_last(self, end):
+        self.cumulative[-1] += end - self.ends[-1]
+        self.ends[-1] = end
+
+    def total(self, t0, t1):
+        i = bisect_right(self.ends, t0)
+        j = bisect_left(self.starts, t1)
+        if i >= j:
+            return 0.0
+        seconds = self.cumulative[j] - self.cumulative[i]
+        if self.starts[i] < t0:
+            seconds -= t0 - self.starts[i]
+        if self.ends[j - 1] > t1:
+            seconds -= self.ends[j - 1] - t1
+        return seconds
+
+    def covered_before(self, times):
+        # Seconds covered before each timestamp; differences of these give
+        # the totals of any number of buckets in one pass.
+        if numpy is None:
+            return [self.total(float('-inf'), t) for t in times]
+        times = numpy.asarray(times, dtype=float)
+        if not self.starts:
+            return numpy.zeros(len(times))
+        starts = numpy.asarray(self.starts)
+        ends = numpy.asarray(self.ends)
+        cumulative = numpy.asarray(self.cumulative)
+        i = numpy.searchsorted(starts, times, side='right')
+        # Only the last interval starting at or before t can straddle it.
+        overhang = numpy.where(i > 0, numpy.clip(ends[i - 1] - times, 0, None), 0.0)
+        return cumulative[i] - overhang
+
+
+class IntervalIndex:
+    """Focus sessions as (app_id, start, end) intervals, queryable by range.
+
+    Samples are appended in time order; a sample that continues the last
+    session of the same app (within ``merge_gap`` seconds) just extends it.
+    Every app gets its own prefix-summed interval list, so the time spent in
+    an app between two timestamps is two bisects, and the all-app total is
+    the same on the combined list.
+    """
+
+    def __init__(self, merge_gap=5.0):
+        self.merge_gap = merge_gap
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.app_ids = {}
+            self.app_names = []
+            self.sessions = []
+            self.all = _Intervals()
+            self.by_app = defaultdict(_Intervals)
+            self.merge_floor = 0
+
+    def seal(self):
+        # Sessions up to here are persisted as-is; new samples start a new one.
+        with self.lock:
+            self.merge_floor = len(self.sessions)
+
+    def app_id(self, app):
+        app_id = self.app_ids.get(app)
+        if app_id is None:
+            app_id = self.app_ids[app] = len(self.app_names)
+            self.app_names.append(app)
+        return app_id
+
+    def add(self, app, start, end):
+        with self.lock:
+            if self.sessions:
+                last_id, last_start, last_end = self.sessions[-1]
+                # Clock steps backwards must not create overlapping intervals.
+                start = max(start, last_end)
+            if end <= start:
+                return
+            app_id = self.app_id(app)
+            if (len(self.sessions) > self.merge_floor and last_id == app_id
+                    and start - last_end <= self.merge_gap):
+                self.sessions[-1] = (app_id, last_start, end)
+                self.all.extend_last(end)
+                self.by_app[app_id].extend_last(end)
+                return
+            self.sessions.append((app_id, start, end))
+            self.all.append(start, end)
+            self.by_app[app_id].append(start, end)
+
+    def trim(self, before, limit):
+        """Drops up to ``limit`` of the oldest sessions, those that ended by
+        ``before``. Returns how many were dropped."""
+        with self.lock:
+            count = min(bisect_right(self.all.ends, before), limit)
+            if count <= 0:
+                return 0
+            del self.sessions[:count]
+            self.merge_floor = max(self.merge_floor - count, 0)
+            self.all = _Intervals()
+            self.by_app = defaultdict(_Intervals)
+            for app_id, start, end in self.sessions:
+                self.all.append(start, end)
+                self.by_app[app_id].append(start, end)
+            return count
+
+    def closed_sessions(self, since=0, include_open=False):
+        # The last session may still be growing unless it's been sealed.
+        with self.lock:
+            stop = len(self.sessions) if include_open else max(len(self.sessions) - 1, self.merge_floor)
+            return [(self.app_names[app_id], start, end)
+                    for app_id, start, end in self.sessions[since:stop]]
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def covered_before(self, times):
+        with self.lock:
+            return self.all.covered_before(times)
+
+    def total(self, t0, t1, app=None):
+        with self.lock:
+            if app is None:
+                return self.all.total(t0, t1)
+            app_id = self.app_ids.get(app)
+            if app_id is None:
+                return 0.0
+            return self.by_app[app_id].total(t0, t1)
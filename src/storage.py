@@ -0,0 +1,1453 @@
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from usage import HourTable, Interner, SessionTable, UsageTable, split_hours
+
+SNAPSHOT_NAME = "snapshot.json"
+# Window-title usage is kept as its own table, keyed "app<TITLE_SEPARATOR>title".
+TITLE_SEPARATOR = "\x1f"
+SUMMARY_NAME = "summary.json"
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+DATABASE_NAME = "tesseract.db"
+
+# Rows the legacy JSON format can't place on both axes: lifetime per-app
+# totals have no day, and per-day totals have no app.
+UNDATED = ""
+UNATTRIBUTED = ""
+
+
+def empty_state():
+    interner = Interner()
+    return {
+        'usage': UsageTable(interner),
+        'sessions': SessionTable(interner),
+        'hourly': HourTable(interner),
+        'session_floor': 0,
+        'titles': UsageTable(Interner()),
+        'app_limits': {},
+        'daily_limits': set(),
+        'break_interval': 60,
+    }
+
+
+def apply_record(state, record):
+    kind = record.get('t')
+    if kind == 'u':
+        for day, apps in record['d'].items():
+            for app, seconds in apps.items():
+                state['usage'].add(day, app, seconds)
+    elif kind == 'T':
+        for day, titles in record['d'].items():
+            for key, seconds in titles.items():
+                state['titles'].add(day, key, seconds)
+    elif kind == 'i':
+        state['sessions'].extend(record['s'])
+    elif kind == 'l':
+        state['app_limits'][record['a']] = record['m']
+        if record.get('daily'):
+            state['daily_limits'].add(record['a'])
+        else:
+            state['daily_limits'].discard(record['a'])
+    elif kind == 'r':
+        state['app_limits'].pop(record['a'], None)
+        state['daily_limits'].discard(record['a'])
+    elif kind == 's':
+        state[record['k']] = record['v']
+    elif kind == 'h':
+        # Retention: sessions before 's' become hourly buckets, and buckets
+        # before 'h' are dropped; the per-day rollups are left alone, so
+        # every total stays exact. Window-title detail goes with the buckets.
+        for app_id, start, end in state['sessions'].split_before(record['s']):
+            state['hourly'].add_span(app_id, start, end)
+        state['hourly'].drop_before(record['h'])
+        _drop_title_days(state, datetime.fromtimestamp(record['h']).strftime("%Y-%m-%d"))
+        state['session_floor'] = max(state['session_floor'], record['s'])
+    elif kind == 'c':
+        state['usage'].clear()
+        state['sessions'].clear()
+        state['hourly'].clear()
+        state['session_floor'] = 0
+        state['titles'].clear()
+        state['app_limits'].clear()
+        state['daily_limits'].clear()
+
+
+def _drop_title_days(state, first_day):
+    titles = state['titles']
+    if not any(day < first_day for day in titles.day_ids):
+        return
+    # Rebuilt rather than trimmed, so the interner drops the old titles too.
+    kept = {day: apps for day, apps in titles.day_apps().items() if day >= first_day}
+    state['titles'] = UsageTable(Interner())
+    state['titles'].load({}, {}, kept)
+
+
+def state_to_dict(state):
+    usage = state['usage']
+    return {
+        'app_usage': usage.app_totals(),
+        'daily_usage': usage.day_totals(),
+        'day_apps': usage.day_apps(),
+        'sessions': list(state['sessions']),
+        'hourly': list(state['hourly']),
+        'session_floor': state['session_floor'],
+        'title_usage': state['titles'].day_apps(),
+        'app_limits': dict(state['app_limits']),
+        'daily_limits': sorted(state['daily_limits']),
+        'break_interval': state['break_interval'],
+    }
+
+
+def state_from_dict(data):
+    state = empty_state()
+    state['usage'].load(data.get('app_usage', {}), data.get('daily_usage', {}), data.get('day_apps', {}))
+    state['sessions'].extend(data.get('sessions', []))
+    for hour, app, seconds in data.get('hourly', []):
+        state['hourly'].add(hour, state['hourly'].interner.id(app), seconds)
+    state['session_floor'] = data.get('session_floor', 0)
+    state['titles'].load({}, {}, data.get('title_usage', {}))
+    state['app_limits'].update(data.get('app_limits', {}))
+    state['daily_limits'].update(data.get('daily_limits', []))
+    state['break_interval'] = data.get('break_interval', 60)
+    return state
+
+
+def summary_to_dict(state):
+    # Everything but sessions and per-day app breakdowns: small however much
+    # history there is, and enough for the dashboard's first frame.
+    data = state_to_dict(state)
+    data['day_apps'] = {}
+    data['sessions'] = []
+    data['hourly'] = []
+    data['title_usage'] = {}
+    return data
+
+
+def _split_titles(totals, app=None):
+    # {app: {title: seconds}} from ("app<sep>title", seconds) pairs.
+    split = defaultdict(lambda: defaultdict(float))
+    for key, seconds in totals:
+        name, _, title = key.partition(TITLE_SEPARATOR)
+        if app is None or name == app:
+            split[name][title] += seconds
+    return {name: dict(titles) for name, titles in split.items()}
+
+
+def _fsync_dir(path):
+    # Directory fsync makes renames durable on POSIX; Windows can't open dirs.
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, data, indent=None):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+class UsageLog:
+    """Append-only, segmented log of usage deltas with periodic snapshots.
+
+    Every flush appends one small fsync'd JSON line to the active segment, so
+    the cost of a save doesn't depend on how much history has been kept.
+    ``take_pending`` and ``write_batch`` split a flush so the disk write can
+    run on another thread without holding the state lock.
+    Sealed segments are folded into ``snapshot.json`` by a background
+    compaction thread; startup replays the snapshot plus whatever segments
+    are newer than it. A torn last line from a crash is simply skipped.
+
+    Compaction also writes ``summary.json``: the snapshot without sessions
+    or per-day app breakdowns. ``load(lazy=True)`` starts from that instead
+    and reads the rest of the history on a background thread; queries that
+    need it wait for ``history_loaded``.
+    """
+
+    def __init__(self, directory, legacy_file=None,
+                 segment_bytes=256 * 1024, compact_after=4):
+        self.directory = directory
+        self.legacy_file = legacy_file
+        self.segment_bytes = segment_bytes
+        self.compact_after = compact_after
+
+        self.state = empty_state()
+        self.pending = []
+        self.pending_usage = defaultdict(lambda: defaultdict(float))
+        self.pending_titles = defaultdict(lambda: defaultdict(float))
+
+        self.segment_seq = 0
+        self.segment_file = None
+        self.bytes_written = 0
+        self.sealed = []
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.compact_lock = threading.Lock()
+        self.compact_thread = None
+        self.history_loaded = threading.Event()
+        self.backlog = None
+
+    # --- Recovery ---
+    def load(self, lazy=False):
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            summary_seq, state = self._read_snapshot(SUMMARY_NAME) if lazy else (0, None)
+            if state is None or summary_seq != self._snapshot_seq():
+                summary_seq, state = self._read_snapshot()
+                if state is None:
+                    state = self._read_legacy()
+                lazy = False
+            segments = [seq for seq in self._list_segments() if seq > summary_seq]
+            for seq in segments:
+                self._replay_segment(seq, state)
+            self.state = state
+            self.sealed = segments
+            self.segment_seq = max(segments + [summary_seq])
+            self._open_segment()
+            if lazy:
+                # Changes made while the history loads are replayed onto it.
+                self.backlog = []
+                threading.Thread(target=self._load_history, args=(segments,), daemon=True).start()
+            else:
+                self.history_loaded.set()
+        self._maybe_compact()
+        return self.state
+
+    def _load_history(self, segments):
+        # Holding compact_lock keeps the segments from being folded away
+        # while they're read.
+        with self.compact_lock:
+            snapshot_seq, history = self._read_snapshot()
+            for seq in segments:
+                if seq > snapshot_seq:
+                    self._replay_segment(seq, history)
+        with self.lock:
+            for record in self.backlog:
+                apply_record(history, record)
+            self.backlog = None
+            self.state['sessions'] = history['sessions']
+            self.state['hourly'] = history['hourly']
+            self.state['titles'] = history['titles']
+            self.state['usage'] = history['usage']
+        self.history_loaded.set()
+
+    def _snapshot_seq(self):
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            # The snapshot is written with 'seq' first; no need to parse it all.
+            head = f.read(64).decode('utf-8', 'replace')
+        try:
+            return int(head.split('"seq":', 1)[1].split(',', 1)[0])
+        except (IndexError, ValueError):
+            return None
+
+    def _read_snapshot(self, name=SNAPSHOT_NAME):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return 0, None
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return data.get('seq', 0), state_from_dict(data.get('state', {}))
+
+    def _read_legacy(self):
+        # One-shot migration from the old single-file tesseract_data.json.
+        if self.legacy_file and os.path.exists(self.legacy_file):
+            try:
+                with open(self.legacy_file, 'r') as f:
+                    return state_from_dict(json.load(f))
+            except (OSError, ValueError):
+                pass
+        return empty_state()
+
+    def _list_segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    segments.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    pass
+        return sorted(segments)
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{seq:06d}{SEGMENT_SUFFIX}")
+
+    def _replay_segment(self, seq, state):
+        with open(self._segment_path(seq), 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write at the tail of a segment; nothing after it was committed.
+                    break
+                apply_record(state, record)
+
+    # --- Queries ---
+    @property
+    def app_limits(self):
+        return self.state['app_limits']
+
+    @property
+    def daily_limits(self):
+        return self.state['daily_limits']
+
+    def get_setting(self, key, default=None):
+        return self.state.get(key, default)
+
+    def app_total(self, app):
+        with self.lock:
+            return self.state['usage'].app_total(app)
+
+    def app_totals(self):
+        with self.lock:
+            return self.state['usage'].app_totals()
+
+    def day_total(self, day):
+        with self.lock:
+            return self.state['usage'].day_total(day)
+
+    def top_apps(self, n, start_day=None, end_day=None):
+        if start_day is None and end_day is None:
+            with self.lock:
+                return self.state['usage'].top_apps(n)
+        totals = self.usage_between(start_day, end_day, group_by='app')
+        return heapq.nlargest(n, totals.items(), key=lambda x: x[1])
+
+    def usage_between(self, start_day, end_day, group_by='app', app=None):
+        if group_by != 'day' or app is not None:
+            self.history_loaded.wait()
+        with self.lock:
+            return self.state['usage'].usage_between(start_day, end_day, group_by, app)
+
+    def sessions(self):
+        self.history_loaded.wait()
+        with self.lock:
+            return list(self.state['sessions'])
+
+    def export_state(self):
+        self.history_loaded.wait()
+        with self.lock:
+            return state_to_dict(self.state)
+
+    @property
+    def session_floor(self):
+        return self.state['session_floor']
+
+    def hourly_usage(self, t0, t1):
+        self.history_loaded.wait()
+        with self.lock:
+            return self.state['hourly'].totals_between(t0, t1)
+
+    def title_usage(self, start_day, end_day, app=None):
+        self.history_loaded.wait()
+        with self.lock:
+            totals = self.state['titles'].usage_between(start_day, end_day)
+        return _split_titles(totals.items(), app)
+
+    def iter_usage(self, start_day=None, end_day=None):
+        # One day is copied under the lock at a time, so a long export
+        # neither holds up the tracker nor copies the whole table.
+        self.history_loaded.wait()
+        with self.lock:
+            days = sorted(day for day in self.state['usage'].day_ids
+                          if not (start_day and day < start_day) and not (end_day and day > end_day))
+        for day in days:
+            with self.lock:
+                items = self.state['usage'].day_items(day)
+            for app, seconds in items:
+                yield day, app, seconds
+
+    def iter_sessions(self, chunk=10000):
+        self.history_loaded.wait()
+        position = 0
+        while True:
+            with self.lock:
+                sessions = self.state['sessions'].slice(position, position + chunk)
+            if not sessions:
+                return
+            yield from sessions
+            position += len(sessions)
+
+    # --- Writes ---
+    def add_usage(self, day, app, seconds):
+        with self.lock:
+            self.state['usage'].add(day, app, seconds)
+            self.pending_usage[day][app] += seconds
+            if self.backlog is not None:
+                self.backlog.append({'t': 'u', 'd': {day: {app: seconds}}})
+
+    def add_title_usage(self, day, app, title, seconds):
+        key = app + TITLE_SEPARATOR + title
+        with self.lock:
+            self.state['titles'].add(day, key, seconds)
+            self.pending_titles[day][key] += seconds
+            if self.backlog is not None:
+                self.backlog.append({'t': 'T', 'd': {day: {key: seconds}}})
+
+    def add_sessions(self, sessions):
+        if sessions:
+            self._record({'t': 'i', 's': [list(session) for session in sessions]})
+
+    def set_limit(self, app, minutes, daily=False):
+        record = {'t': 'l', 'a': app, 'm': minutes}
+        if daily:
+            record['daily'] = True
+        self._record(record)
+
+    def remove_limit(self, app):
+        self._record({'t': 'r', 'a': app})
+
+    def set_setting(self, key, value):
+        self._record({'t': 's', 'k': key, 'v': value})
+
+    def clear(self):
+        self._record({'t': 'c'})
+
+    def downsample(self, session_cutoff, hourly_cutoff):
+        self.history_loaded.wait()
+        self._record({'t': 'h', 's': session_cutoff, 'h': hourly_cutoff})
+
+    def _record(self, record):
+        with self.lock:
+            self._queue_usage()
+            apply_record(self.state, record)
+            self.pending.append(record)
+            if self.backlog is not None:
+                self.backlog.append(record)
+
+    def _queue_usage(self):
+        # Usage is coalesced until the next non-usage record so ordering is kept.
+        if self.pending_usage:
+            self.pending.append({'t': 'u', 'd': {day: dict(apps) for day, apps in self.pending_usage.items()}})
+            self.pending_usage.clear()
+        if self.pending_titles:
+            self.pending.append({'t': 'T', 'd': {day: dict(titles) for day, titles in self.pending_titles.items()}})
+            self.pending_titles.clear()
+
+    def take_pending(self):
+        with self.lock:
+            self._queue_usage()
+            batch, self.pending = tuple(self.pending), []
+            return batch
+
+    def write_batch(self, batch):
+        if not batch:
+            return 0
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in batch)
+        with self.io_lock:
+            position = self.segment_file.tell()
+            try:
+                self.segment_file.write(data)
+                self.segment_file.flush()
+                os.fsync(self.segment_file.fileno())
+            except Exception:
+                # Roll back a partial append so retrying the batch can neither
+                # double-count it nor leave a torn line mid-segment.
+                try:
+                    self.segment_file.truncate(position)
+                    self.segment_file.seek(position)
+                except Exception:
+                    pass
+                raise
+            self.bytes_written += self.segment_file.tell() - position
+            rotate = self.segment_file.tell() >= self.segment_bytes
+            if rotate:
+                self._seal_segment()
+                self._open_segment()
+        if rotate:
+            self._maybe_compact()
+        return len(batch)
+
+    def flush(self):
+        return self.write_batch(self.take_pending())
+
+    def _open_segment(self):
+        self.segment_seq += 1
+        self.segment_file = open(self._segment_path(self.segment_seq), 'a')
+        _fsync_dir(self.directory)
+
+    def _seal_segment(self):
+        self.segment_file.close()
+        with self.lock:
+            self.sealed.append(self.segment_seq)
+
+    # --- Compaction ---
+    def _maybe_compact(self):
+        if len(self.sealed) < self.compact_after:
+            return
+        if self.compact_thread and self.compact_thread.is_alive():
+            return
+        self.compact_thread = threading.Thread(target=self.compact, daemon=True)
+        self.compact_thread.start()
+
+    def compact(self):
+        # Folds sealed segments into a fresh snapshot from disk alone, so the
+        # live state and the active segment are never touched.
+        with self.compact_lock:
+            with self.lock:
+                sealed = list(self.sealed)
+            if not sealed:
+                return
+            snapshot_seq, state = self._read_snapshot()
+            if state is None:
+                state = self._read_legacy()
+            for seq in sealed:
+                if seq > snapshot_seq:
+                    self._replay_segment(seq, state)
+            write_json_atomic(os.path.join(self.directory, SNAPSHOT_NAME), {
+                'seq': sealed[-1],
+                'state': state_to_dict(state),
+            })
+            write_json_atomic(os.path.join(self.directory, SUMMARY_NAME), {
+                'seq': sealed[-1],
+                'state': summary_to_dict(state),
+            })
+            for seq in sealed:
+                try:
+                    os.remove(self._segment_path(seq))
+                except OSError:
+                    pass
+            with self.lock:
+                self.sealed = [seq for seq in self.sealed if seq > sealed[-1]]
+
+    def close(self):
+        self.flush()
+        with self.io_lock:
+            if self.segment_file.tell() > 0:
+                self._seal_segment()
+            else:
+                self.segment_file.close()
+                os.remove(self._segment_path(self.segment_seq))
+        if self.compact_thread:
+            self.compact_thread.join()
+        if len(self.sealed) >= self.compact_after:
+            self.compact()
+
+
+class SqliteStore:
+    """SQLite usage store holding one (day, app, seconds) row per pair.
+
+    ``app_totals`` and ``day_totals`` are kept alongside in the same
+    transaction so lifetime top-N and today's total are index lookups rather
+    than scans. Usage, limit and setting changes are buffered in memory and
+    written as one transaction per flush; reads overlay usage that is still
+    pending or in flight on the writer thread.
+    """
+
+    def __init__(self, path, legacy_dir=None, legacy_file=None):
+        self.path = path
+        self.legacy_dir = legacy_dir
+        self.legacy_file = legacy_file
+        self.conn = None
+        self.limits = {}
+        self.daily = set()
+        self.settings = {}
+        self.pending_usage = defaultdict(float)
+        self.pending_titles = defaultdict(float)
+        self.pending_sessions = []
+        self.pending_ops = []
+        self.inflight = []
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.history_loaded = threading.Event()
+
+    def load(self, lazy=False):
+        # Queries read the database on demand, so there's nothing to defer.
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            with self.conn:
+                self.conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS usage (
+                        day TEXT NOT NULL,
+                        app TEXT NOT NULL,
+                        seconds REAL NOT NULL,
+                        PRIMARY KEY (day, app)
+                    ) WITHOUT ROWID;
+                    CREATE INDEX IF NOT EXISTS usage_app_day ON usage (app, day);
+                    CREATE TABLE IF NOT EXISTS app_totals (
+                        app TEXT PRIMARY KEY,
+                        seconds REAL NOT NULL
+                    ) WITHOUT ROWID;
+                    CREATE INDEX IF NOT EXISTS app_totals_seconds ON app_totals (seconds);
+                    CREATE TABLE IF NOT EXISTS day_totals (
+                        day TEXT PRIMARY KEY,
+                        seconds REAL NOT NULL
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        app TEXT NOT NULL,
+                        start REAL NOT NULL,
+                        end REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start);
+                    CREATE TABLE IF NOT EXISTS title_usage (
+                        day TEXT NOT NULL,
+                        app TEXT NOT NULL,
+                        title TEXT NOT NULL,
+                        seconds REAL NOT NULL,
+                        PRIMARY KEY (day, app, title)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS hourly (
+                        hour REAL NOT NULL,
+                        app TEXT NOT NULL,
+                        seconds REAL NOT NULL,
+                        PRIMARY KEY (hour, app)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS limits (
+                        app TEXT PRIMARY KEY,
+                        minutes INTEGER NOT NULL,
+                        daily INTEGER NOT NULL DEFAULT 0
+                    );
+                    CREATE TABLE IF NOT EXISTS settings (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL
+                    );
+                """)
+                columns = [row[1] for row in self.conn.execute("PRAGMA table_info(limits)")]
+                if 'daily' not in columns:
+                    self.conn.execute("ALTER TABLE limits ADD COLUMN daily INTEGER NOT NULL DEFAULT 0")
+            migrated = self.conn.execute("SELECT value FROM settings WHERE key = 'migrated'").fetchone()
+        if not migrated:
+            self._migrate()
+        with self.lock:
+            for app, minutes, daily in self.conn.execute("SELECT app, minutes, daily FROM limits"):
+                self.limits[app] = minutes
+                if daily:
+                    self.daily.add(app)
+            self.settings = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM settings")}
+        self.history_loaded.set()
+
+    def _migrate(self):
+        # One-shot import of whatever the log store (or the JSON file before
+        # it) holds. Totals that can't be split by day or app are kept on
+        # UNDATED / UNATTRIBUTED rows so every aggregate stays exact.
+        log = UsageLog(self.legacy_dir, legacy_file=self.legacy_file) if self.legacy_dir else None
+        if log:
+            log.load()
+            state = log.state
+        else:
+            state = empty_state()
+        rows = []
+        dated_by_app = defaultdict(float)
+        day_apps = state['usage'].day_apps()
+        daily_usage = state['usage'].day_totals()
+        for day, apps in day_apps.items():
+            for app, seconds in apps.items():
+                rows.append((day, app, seconds))
+                dated_by_app[app] += seconds
+            unattributed = daily_usage.get(day, 0) - sum(apps.values())
+            if unattributed > 0:
+                rows.append((day, UNATTRIBUTED, unattributed))
+        for day, seconds in daily_usage.items():
+            if day not in day_apps and seconds > 0:
+                rows.append((day, UNATTRIBUTED, seconds))
+        for app, seconds in state['usage'].app_totals().items():
+            undated = seconds - dated_by_app.get(app, 0)
+            if undated > 0:
+                rows.append((UNDATED, app, undated))
+        with self.lock, self.conn:
+            self._write_rows(rows)
+            self.conn.executemany("INSERT INTO sessions (app, start, end) VALUES (?, ?, ?)", iter(state['sessions']))
+            self.conn.executemany("INSERT OR REPLACE INTO limits (app, minutes, daily) VALUES (?, ?, ?)",
+                                  [(app, minutes, app in state['daily_limits'])
+                                   for app, minutes in state['app_limits'].items()])
+            self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('break_interval', ?)",
+                              (json.dumps(state['break_interval']),))
+            self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('migrated', 'true')")
+        if log:
+            log.close()
+
+    def _write_rows(self, rows):
+        self.conn.executemany("""
+            INSERT INTO usage (day, app, seconds) VALUES (?, ?, ?)
+            ON CONFLICT (day, app) DO UPDATE SET seconds = seconds + excluded.seconds
+        """, rows)
+        self.conn.executemany("""
+            INSERT INTO app_totals (app, seconds) VALUES (?, ?)
+            ON CONFLICT (app) DO UPDATE SET seconds = seconds + excluded.seconds
+        """, [(app, seconds) for day, app, seconds in rows if app != UNATTRIBUTED])
+        self.conn.executemany("""
+            INSERT INTO day_totals (day, seconds) VALUES (?, ?)
+            ON CONFLICT (day) DO UPDATE SET seconds = seconds + excluded.seconds
+        """, [(day, seconds) for day, app, seconds in rows if day != UNDATED])
+
+    # --- Queries ---
+    @property
+    def app_limits(self):
+        return self.limits
+
+    @property
+    def daily_limits(self):
+        return self.daily
+
+    def get_setting(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def _unwritten(self):
+        yield from self.pending_usage.items()
+        for batch in self.inflight:
+            yield from batch[0]
+
+    def app_total(self, app):
+        with self.lock:
+            row = self.conn.execute("SELECT seconds FROM app_totals WHERE app = ?", (app,)).fetchone()
+            pending = sum(seconds for (day, name), seconds in self._unwritten() if name == app)
+        return (row[0] if row else 0) + pending
+
+    def app_totals(self):
+        with self.lock:
+            totals = defaultdict(float, self.conn.execute("SELECT app, seconds FROM app_totals"))
+            for (day, app), seconds in self._unwritten():
+                totals[app] += seconds
+        return dict(totals)
+
+    def day_total(self, day):
+        with self.lock:
+            row = self.conn.execute("SELECT seconds FROM day_totals WHERE day = ?", (day,)).fetchone()
+            pending = sum(seconds for (name, app), seconds in self._unwritten() if name == day)
+        return (row[0] if row else 0) + pending
+
+    def top_apps(self, n, start_day=None, end_day=None):
+        if start_day is not None or end_day is not None:
+            totals = self.usage_between(start_day, end_day, group_by='app')
+            return heapq.nlargest(n, totals.items(), key=lambda x: x[1])
+        with self.lock:
+            pending = defaultdict(float)
+            for (day, app), seconds in self._unwritten():
+                pending[app] += seconds
+            # Any app outside the stored top n + len(pending) can't be lifted
+            # past it by the unflushed buffer, so the candidates stay small.
+            totals = dict(self.conn.execute(
+                "SELECT app, seconds FROM app_totals ORDER BY seconds DESC LIMIT ?",
+                (n + len(pending),)))
+            missing = [app for app in pending if app not in totals]
+            if missing:
+                placeholders = ','.join('?' * len(missing))
+                totals.update(self.conn.execute(
+                    f"SELECT app, seconds FROM app_totals WHERE app IN ({placeholders})", missing))
+        for app, seconds in pending.items():
+            totals[app] = totals.get(app, 0) + seconds
+        return heapq.nlargest(n, totals.items(), key=lambda x: x[1])
+
+    def usage_between(self, start_day, end_day, group_by='app', app=None):
+        column = 'day' if group_by == 'day' else 'app'
+        start_day = start_day or '0000-00-00'
+        end_day = end_day or '9999-99-99'
+        excluded = UNDATED if group_by == 'day' else UNATTRIBUTED
+        params = (start_day, end_day, excluded)
+        only_app = ""
+        if app is not None:
+            only_app = "AND app = ?"
+            params += (app,)
+        with self.lock:
+            totals = defaultdict(float, self.conn.execute(f"""
+                SELECT {column}, SUM(seconds) FROM usage
+                WHERE day BETWEEN ? AND ? AND {column} != ? {only_app}
+                GROUP BY {column}
+            """, params))
+            for (day, name), seconds in self._unwritten():
+                if start_day <= day <= end_day and app in (None, name):
+                    totals[day if group_by == 'day' else name] += seconds
+        return dict(totals)
+
+    def sessions(self):
+        with self.lock:
+            stored = self.conn.execute("SELECT app, start, end FROM sessions ORDER BY start").fetchall()
+            inflight = [session for batch in self.inflight for session in batch[1]]
+            return stored + inflight + self.pending_sessions
+
+    def export_state(self):
+        self.flush()
+        state = empty_state()
+        with self.lock:
+            day_apps = defaultdict(dict)
+            for day, app, seconds in self.conn.execute(
+                    "SELECT day, app, seconds FROM usage WHERE day != ? AND app != ?", (UNDATED, UNATTRIBUTED)):
+                day_apps[day][app] = seconds
+            state['usage'].load(dict(self.conn.execute("SELECT app, seconds FROM app_totals")),
+                                dict(self.conn.execute("SELECT day, seconds FROM day_totals")), day_apps)
+            state['sessions'].extend(self.conn.execute("SELECT app, start, end FROM sessions ORDER BY start"))
+            for hour, app, seconds in self.conn.execute("SELECT hour, app, seconds FROM hourly"):
+                state['hourly'].add(hour, state['hourly'].interner.id(app), seconds)
+        state['session_floor'] = self.session_floor
+        state['app_limits'].update(self.limits)
+        state['daily_limits'].update(self.daily)
+        state['break_interval'] = self.settings.get('break_interval', 60)
+        return state_to_dict(state)
+
+    @property
+    def session_floor(self):
+        return self.settings.get('session_floor', 0)
+
+    def hourly_usage(self, t0, t1):
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT hour, SUM(seconds) FROM hourly WHERE hour >= ? AND hour < ? GROUP BY hour", (t0, t1)))
+
+    def title_usage(self, start_day, end_day, app=None):
+        start_day = start_day or '0000-00-00'
+        end_day = end_day or '9999-99-99'
+        with self.lock:
+            rows = [(app_name + TITLE_SEPARATOR + title, seconds) for app_name, title, seconds in self.conn.execute(
+                "SELECT app, title, SUM(seconds) FROM title_usage WHERE day BETWEEN ? AND ? GROUP BY app, title",
+                (start_day, end_day))]
+            pending = list(self.pending_titles.items())
+            for batch in self.inflight:
+                pending.extend(batch[3])
+        rows += [(app_name + TITLE_SEPARATOR + title, seconds)
+                 for (day, app_name, title), seconds in pending if start_day <= day <= end_day]
+        return _split_titles(rows, app)
+
+    def iter_usage(self, start_day=None, end_day=None):
+        # Reads through a connection of its own: WAL gives it a consistent
+        # snapshot without blocking the writer, and rows are fetched lazily.
+        self.flush()
+        reader = sqlite3.connect(self.path)
+        try:
+            yield from reader.execute(
+                "SELECT day, app, seconds FROM usage WHERE day BETWEEN ? AND ? AND day != ? AND app != ? "
+                "ORDER BY day, app",
+                (start_day or '0000-00-00', end_day or '9999-99-99', UNDATED, UNATTRIBUTED))
+        finally:
+            reader.close()
+
+    def iter_sessions(self):
+        self.flush()
+        reader = sqlite3.connect(self.path)
+        try:
+            yield from reader.execute("SELECT app, start, end FROM sessions ORDER BY start")
+        finally:
+            reader.close()
+
+    # --- Writes ---
+    def add_usage(self, day, app, seconds):
+        with self.lock:
+            self.pending_usage[(day, app)] += seconds
+
+    def add_title_usage(self, day, app, title, seconds):
+        with self.lock:
+            self.pending_titles[(day, app, title)] += seconds
+
+    def add_sessions(self, sessions):
+        with self.lock:
+            self.pending_sessions.extend(tuple(session) for session in sessions)
+
+    def set_limit(self, app, minutes, daily=False):
+        with self.lock:
+            self.limits[app] = minutes
+            if daily:
+                self.daily.add(app)
+            else:
+                self.daily.discard(app)
+            self.pending_ops.append(("INSERT OR REPLACE INTO limits (app, minutes, daily) VALUES (?, ?, ?)",
+                                     (app, minutes, daily)))
+
+    def remove_limit(self, app):
+        with self.lock:
+            self.limits.pop(app, None)
+            self.daily.discard(app)
+            self.pending_ops.append(("DELETE FROM limits WHERE app = ?", (app,)))
+
+    def set_setting(self, key, value):
+        with self.lock:
+            self.settings[key] = value
+            self.pending_ops.append(("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                                     (key, json.dumps(value))))
+
+    def clear(self):
+        # Rare and explicitly confirmed by the user, so done synchronously
+        # rather than teaching every read to hide rows a pending clear drops.
+        self.flush()
+        with self.io_lock, self.lock, self.conn:
+            self.pending_usage.clear()
+            self.pending_titles.clear()
+            self.pending_sessions = []
+            for table in ('usage', 'app_totals', 'day_totals', 'sessions', 'hourly', 'title_usage', 'limits'):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute("DELETE FROM settings WHERE key = 'session_floor'")
+            self.settings.pop('session_floor', None)
+            self.limits.clear()
+            self.daily.clear()
+
+    def downsample(self, session_cutoff, hourly_cutoff):
+        # Sessions before the cutoff are bucketed by hour and replaced by
+        # whatever is left of them, a day at a time on a connection of its
+        # own. Reads (and the tracker's adds) never wait for it, since the
+        # store lock isn't taken; other writes wait one day's batch at most.
+        self.flush()
+        conn = sqlite3.connect(self.path)
+        try:
+            start = conn.execute("SELECT MIN(start) FROM sessions").fetchone()[0]
+            while start is not None and start < session_cutoff:
+                next_day = datetime.combine(datetime.fromtimestamp(start).date() + timedelta(days=1), time())
+                bound = min(next_day.timestamp(), session_cutoff)
+                old = conn.execute("SELECT rowid, app, start, end FROM sessions WHERE start < ?",
+                                   (bound,)).fetchall()
+                buckets = defaultdict(float)
+                remainders = []
+                for _, app, begin, end in old:
+                    for hour, seconds in split_hours(begin, min(end, session_cutoff)):
+                        buckets[(hour, app)] += seconds
+                    if end > session_cutoff:
+                        remainders.append((app, session_cutoff, end))
+                with self.io_lock, conn:
+                    conn.executemany("""
+                        INSERT INTO hourly (hour, app, seconds) VALUES (?, ?, ?)
+                        ON CONFLICT (hour, app) DO UPDATE SET seconds = seconds + excluded.seconds
+                    """, [(hour, app, seconds) for (hour, app), seconds in buckets.items()])
+                    # By rowid: an old session imported meanwhile isn't bucketed yet.
+                    conn.executemany("DELETE FROM sessions WHERE rowid = ?", [(row[0],) for row in old])
+                    conn.executemany("INSERT INTO sessions (app, start, end) VALUES (?, ?, ?)", remainders)
+                start = conn.execute("SELECT MIN(start) FROM sessions WHERE start >= ?", (bound,)).fetchone()[0]
+            floor = max(self.session_floor, session_cutoff)
+            with self.io_lock, conn:
+                conn.execute("DELETE FROM hourly WHERE hour < ?", (hourly_cutoff,))
+                conn.execute("DELETE FROM title_usage WHERE day < ?",
+                             (datetime.fromtimestamp(hourly_cutoff).strftime("%Y-%m-%d"),))
+                conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('session_floor', ?)",
+                             (json.dumps(floor),))
+        finally:
+            conn.close()
+        with self.lock:
+            self.settings['session_floor'] = floor
+
+    def take_pending(self):
+        with self.lock:
+            self._queue_usage()
+            batch, self.pending = tuple(self.pending), []
+            return batch
+
+    def write_batch(self, batch):
+        if not batch:
+            return 0
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in batch)
+        with self.io_lock:
+            position = self.segment_file.tell()
+            try:
+                self.segment_file.write(data)
+                self.segment_file.flush()
+                os.fsync(self.segment_file.fileno())
+            except Exception:
+                # Roll back a partial append so retrying the batch can neither
+                # double-count it nor leave a torn line mid-segment.
+                try:
+                    self.segment_file.truncate(position)
+                    self.segment_file.seek(position)
+                except Exception:
+                    pass
+                raise
+            self.bytes_written += self.segment_file.tell() - position
+            rotate = self.segment_file.tell() >= self.segment_bytes
+            if rotate:
+                self._seal_segment()
+                self._open_segment()
+        if rotate:
+            self._maybe_compact()
+        return len(batch)
+
+    def flush(self):
+        return self.write_batch(self.take_pending())
+
+    def _open_segment(self):
+        self.segment_seq += 1
+        self.segment_file = open(self._segment_path(self.segment_seq), 'a')
+        _fsync_dir(self.directory)
+
+    def _seal_segment(self):
+        self.segment_file.close()
+        with self.lock:
+            self.sealed.append(self.segment_seq)
+
+    # --- Compaction ---
+    def _maybe_compact(self):
+        if len(self.sealed) < self.compact_after:
+            return
+        if self.compact_thread and self.compact_thread.is_alive():
+            return
+        self.compact_thread = threading.Thread(target=self.compact, daemon=True)
+        self.compact_thread.start()
+
+    def compact(self):
+        # Folds sealed segments into a fresh snapshot from disk alone, so the
+        # live state and the active segment are never touched.
+        with self.compact_lock:
+            with self.lock:
+                sealed = list(self.sealed)
+            if not sealed:
+                return
+            snapshot_seq, state = self._read_snapshot()
+            if state is None:
+                state = self._read_legacy()
+            for seq in sealed:
+                if seq > snapshot_seq:
+                    self._replay_segment(seq, state)
+            write_json_atomic(os.path.join(self.directory, SNAPSHOT_NAME), {
+                'seq': sealed[-1],
+                'state': state_to_dict(state),
+            })
+            write_json_atomic(os.path.join(self.directory, SUMMARY_NAME), {
+                'seq': sealed[-1],
+                'state': summary_to_dict(state),
+            })
+            for seq in sealed:
+                try:
+                    os.remove(self._segment_path(seq))
+                except OSError:
+                    pass
+            with self.lock:
+                self.sealed = [seq for seq in self.sealed if seq > sealed[-1]]
+
+    def close(self):
+        self.flush()
+        with self.io_lock:
+            if self.segment_file.tell() > 0:
+                self._seal_segment()
+            else:
+                self.segment_file.close()
+                os.remove(self._segment_path(self.segment_seq))
+        if self.compact_thread:
+            self.compact_thread.join()
+        if len(self.sealed) >= self.compact_after:
+            self.compact()
+
+
+class SqliteStore:
+    """SQLite usage store holding one (day, app, seconds) row per pair.
+
+    ``app_totals`` and ``day_totals`` are kept alongside in the same
+    transaction so lifetime top-N and today's total are index lookups rather
+    than scans. Usage, limit and setting changes are buffered in memory and
+    written as one transaction per flush; reads overlay usage that is still
+    pending or in flight on the writer thread.
+    """
+
+    def __init__(self, path, legacy_dir=None, legacy_file=None):
+        self.path = path
+        self.legacy_dir = legacy_dir
+        self.legacy_file = legacy_file
+        self.conn = None
+        self.limits = {}
+        self.daily = set()
+        self.settings = {}
+        self.pending_usage = defaultdict(float)
+        self.pending_titles = defaultdict(float)
+        self.pending_sessions = []
+        self.pending_ops = []
+        self.inflight = []
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.history_loaded = threading.Event()
+
+    def load(self, lazy=False):
+        # Queries read the database on demand, so there's nothing to defer.
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            with self.conn:
+                self.conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS usage (
+                        day TEXT NOT NULL,
+                        app TEXT NOT NULL,
+                        seconds REAL NOT NULL,
+                        PRIMARY KEY (day, app)
+                    ) WITHOUT ROWID;
+                    CREATE INDEX IF NOT EXISTS usage_app_day ON usage (app, day);
+                    CREATE TABLE IF NOT EXISTS app_totals (
+                        app TEXT PRIMARY KEY,
+                        seconds REAL NOT NULL
+                    ) WITHOUT ROWID;
+                    CREATE INDEX IF NOT EXISTS app_totals_seconds ON app_totals (seconds);
+                    CREATE TABLE IF NOT EXISTS day_totals (
+                        day TEXT PRIMARY KEY,
+                        seconds REAL NOT NULL
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        app TEXT NOT NULL,
+                        start REAL NOT NULL,
+                        end REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start);
+                    CREATE TABLE IF NOT EXISTS title_usage (
+                        day TEXT NOT NULL,
+                        app TEXT NOT NULL,
+                        title TEXT NOT NULL,
+                        seconds REAL NOT NULL,
+                        PRIMARY KEY (day, app, title)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS hourly (
+                        hour REAL NOT NULL,
+                        app TEXT NOT NULL,
+                        seconds REAL NOT NULL,
+                        PRIMARY KEY (hour, app)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS limits (
+                        app TEXT PRIMARY KEY,
+                        minutes INTEGER NOT NULL,
+                        daily INTEGER NOT NULL DEFAULT 0
+                    );
+                    CREATE TABLE IF NOT EXISTS settings (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL
+                    );
+                """)
+                columns = [row[1] for row in self.conn.execute("PRAGMA table_info(limits)")]
+                if 'daily' not in columns:
+                    self.conn.execute("ALTER TABLE limits ADD COLUMN daily INTEGER NOT NULL DEFAULT 0")
+            migrated = self.conn.execute("SELECT value FROM settings WHERE key = 'migrated'").fetchone()
+        if not migrated:
+            self._migrate()
+        with self.lock:
+            for app, minutes, daily in self.conn.execute("SELECT app, minutes, daily FROM limits"):
+                self.limits[app] = minutes
+                if daily:
+                    self.daily.add(app)
+            self.settings = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM settings")}
+        self.history_loaded.set()
+
+    def _migrate(self):
+        # One-shot import of whatever the log store (or the JSON file before
+        # it) holds. Totals that can't be split by day or app are kept on
+        # UNDATED / UNATTRIBUTED rows so every aggregate stays exact.
+        log = UsageLog(self.legacy_dir, legacy_file=self.legacy_file) if self.legacy_dir else None
+        if log:
+            log.load()
+            state = log.state
+        else:
+            state = empty_state()
+        rows = []
+        dated_by_app = defaultdict(float)
+        day_apps = state['usage'].day_apps()
+        daily_usage = state['usage'].day_totals()
+        for day, apps in day_apps.items():
+            for app, seconds in apps.items():
+                rows.append((day, app, seconds))
+                dated_by_app[app] += seconds
+            unattributed = daily_usage.get(day, 0) - sum(apps.values())
+            if unattributed > 0:
+                rows.append((day, UNATTRIBUTED, unattributed))
+        for day, seconds in daily_usage.items():
+            if day not in day_apps and seconds > 0:
+                rows.append((day, UNATTRIBUTED, seconds))
+        for app, seconds in state['usage'].app_totals().items():
+            undated = seconds - dated_by_app.get(app, 0)
+            if undated > 0:
+                rows.append((UNDATED, app, undated))
+        with self.lock, self.conn:
+            self._write_rows(rows)
+            self.conn.executemany("INSERT INTO sessions (app, start, end) VALUES (?, ?, ?)", iter(state['sessions']))
+            self.conn.executemany("INSERT OR REPLACE INTO limits (app, minutes, daily) VALUES (?, ?, ?)",
+                                  [(app, minutes, app in state['daily_limits'])
+                                   for app, minutes in state['app_limits'].items()])
+            self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('break_interval', ?)",
+                              (json.dumps(state['break_interval']),))
+            self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('migrated', 'true')")
+        if log:
+            log.close()
+
+    def _write_rows(self, rows):
+        self.conn.executemany("""
+            INSERT INTO usage (day, app, seconds) VALUES (?, ?, ?)
+            ON CONFLICT (day, app) DO UPDATE SET seconds = seconds + excluded.seconds
+        """, rows)
+        self.conn.executemany("""
+            INSERT INTO app_totals (app, seconds) VALUES (?, ?)
+            ON CONFLICT (app) DO UPDATE SET seconds = seconds + excluded.seconds
+        """, [(app, seconds) for day, app, seconds in rows if app != UNATTRIBUTED])
+        self.conn.executemany("""
+            INSERT INTO day_totals (day, seconds) VALUES (?, ?)
+            ON CONFLICT (day) DO UPDATE SET seconds = seconds + excluded.seconds
+        """, [(day, seconds) for day, app, seconds in rows if day != UNDATED])
+
+    # --- Queries ---
+    @property
+    def app_limits(self):
+        return self.limits
+
+    @property
+    def daily_limits(self):
+        return self.daily
+
+    def get_setting(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def _unwritten(self):
+        yield from self.pending_usage.items()
+        for batch in self.inflight:
+            yield from batch[0]
+
+    def app_total(self, app):
+        with self.lock:
+            row = self.conn.execute("SELECT seconds FROM app_totals WHERE app = ?", (app,)).fetchone()
+            pending = sum(seconds for (day, name), seconds in self._unwritten() if name == app)
+        return (row[0] if row else 0) + pending
+
+    def app_totals(self):
+        with self.lock:
+            totals = defaultdict(float, self.conn.execute("SELECT app, seconds FROM app_totals"))
+            for (day, app), seconds in self._unwritten():
+                totals[app] += seconds
+        return dict(totals)
+
+    def day_total(self, day):
+        with self.lock:
+            row = self.conn.execute("SELECT seconds FROM day_totals WHERE day = ?", (day,)).fetchone()
+            pending = sum(seconds for (name, app), seconds in self._unwritten() if name == day)
+        return (row[0] if row else 0) + pending
+
+    def top_apps(self, n, start_day=None, end_day=None):
+        if start_day is not None or end_day is not None:
+            totals = self.usage_between(start_day, end_day, group_by='app')
+            return heapq.nlargest(n, totals.items(), key=lambda x: x[1])
+        with self.lock:
+            pending = defaultdict(float)
+            for (day, app), seconds in self._unwritten():
+                pending[app] += seconds
+            # Any app outside the stored top n + len(pending) can't be lifted
+            # past it by the unflushed buffer, so the candidates stay small.
+            totals = dict(self.conn.execute(
+                "SELECT app, seconds FROM app_totals ORDER BY seconds DESC LIMIT ?",
+                (n + len(pending),)))
+            missing = [app for app in pending if app not in totals]
+            if missing:
+                placeholders = ','.join('?' * len(missing))
+                totals.update(self.conn.execute(
+                    f"SELECT app, seconds FROM app_totals WHERE app IN ({placeholders})", missing))
+        for app, seconds in pending.items():
+            totals[app] = totals.get(app, 0) + seconds
+        return heapq.nlargest(n, totals.items(), key=lambda x: x[1])
+
+    def usage_between(self, start_day, end_day, group_by='app', app=None):
+        column = 'day' if group_by == 'day' else 'app'
+        start_day = start_day or '0000-00-00'
+        end_day = end_day or '9999-99-99'
+        excluded = UNDATED if group_by == 'day' else UNATTRIBUTED
+        params = (start_day, end_day, excluded)
+        only_app = ""
+        if app is not None:
+            only_app = "AND app = ?"
+            params += (app,)
+        with self.lock:
+            totals = defaultdict(float, self.conn.execute(f"""
+                SELECT {column}, SUM(seconds) FROM usage
+                WHERE day BETWEEN ? AND ? AND {column} != ? {only_app}
+                GROUP BY {column}
+            """, params))
+            for (day, name), seconds in self._unwritten():
+                if start_day <= day <= end_day and app in (None, name):
+                    totals[day if group_by == 'day' else name] += seconds
+        return dict(totals)
+
+    def sessions(self):
+        with self.lock:
+            stored = self.conn.execute("SELECT app, start, end FROM sessions ORDER BY start").fetchall()
+            inflight = [session for batch in self.inflight for session in batch[1]]
+            return stored + inflight + self.pending_sessions
+
+    def export_state(self):
+        self.flush()
+        state = empty_state()
+        with self.lock:
+            day_apps = defaultdict(dict)
+            for day, app, seconds in self.conn.execute(
+                    "SELECT day, app, seconds FROM usage WHERE day != ? AND app != ?", (UNDATED, UNATTRIBUTED)):
+                day_apps[day][app] = seconds
+            state['usage'].load(dict(self.conn.execute("SELECT app, seconds FROM app_totals")),
+                                dict(self.conn.execute("SELECT day, seconds FROM day_totals")), day_apps)
+            state['sessions'].extend(self.conn.execute("SELECT app, start, end FROM sessions ORDER BY start"))
+            for hour, app, seconds in self.conn.execute("SELECT hour, app, seconds FROM hourly"):
+                state['hourly'].add(hour, state['hourly'].interner.id(app), seconds)
+        state['session_floor'] = self.session_floor
+        state['app_limits'].update(self.limits)
+        state['daily_limits'].update(self.daily)
+        state['break_interval'] = self.settings.get('break_interval', 60)
+        return state_to_dict(state)
+
+    @property
+    def session_floor(self):
+        return self.settings.get('session_floor', 0)
+
+    def hourly_usage(self, t0, t1):
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT hour, SUM(seconds) FROM hourly WHERE hour >= ? AND hour < ? GROUP BY hour", (t0, t1)))
+
+    def title_usage(self, start_day, end_day, app=None):
+        start_day = start_day or '0000-00-00'
+        end_day = end_day or '9999-99-99'
+        with self.lock:
+            rows = [(app_name + TITLE_SEPARATOR + title, seconds) for app_name, title, seconds in self.conn.execute(
+                "SELECT app, title, SUM(seconds) FROM title_usage WHERE day BETWEEN ? AND ? GROUP BY app, title",
+                (start_day, end_day))]
+            pending = list(self.pending_titles.items())
+            for batch in self.inflight:
+                pending.extend(batch[3])
+        rows += [(app_name + TITLE_SEPARATOR + title, seconds)
+                 for (day, app_name, title), seconds in pending if start_day <= day <= end_day]
+        return _split_titles(rows, app)
+
+    def iter_usage(self, start_day=None, end_day=None):
+        # Reads through a connection of its own: WAL gives it a consistent
+        # snapshot without blocking the writer, and rows are fetched lazily.
+        self.flush()
+        reader = sqlite3.connect(self.path)
+        try:
+            yield from reader.execute(
+                "SELECT day, app, seconds FROM usage WHERE day BETWEEN ? AND ? AND day != ? AND app != ? "
+                "ORDER BY day, app",
+                (start_day or '0000-00-00', end_day or '9999-99-99', UNDATED, UNATTRIBUTED))
+        finally:
+            reader.close()
+
+    def iter_sessions(self):
+        self.flush()
+        reader = sqlite3.connect(self.path)
+        try:
+            yield from reader.execute("SELECT app, start, end FROM sessions ORDER BY start")
+        finally:
+            reader.close()
+
+    # --- Writes ---
+    def add_usage(self, day, app, seconds):
+        with self.lock:
+            self.pending_usage[(day, app)] += seconds
+
+    def add_title_usage(self, day, app, title, seconds):
+        with self.lock:
+            self.pending_titles[(day, app, title)] += seconds
+
+    def add_sessions(self, sessions):
+        with self.lock:
+            self.pending_sessions.extend(tuple(session) for session in sessions)
+
+    def set_limit(self, app, minutes, daily=False):
+        with self.lock:
+            self.limits[app] = minutes
+            if daily:
+                self.daily.add(app)
+            else:
+                self.daily.discard(app)
+            self.pending_ops.append(("INSERT OR REPLACE INTO limits (app, minutes, daily) VALUES (?, ?, ?)",
+                                     (app, minutes, daily)))
+
+    def remove_limit(self, app):
+        with self.lock:
+            self.limits.pop(app, None)
+            self.daily.discard(app)
+            self.pending_ops.append(("DELETE FROM limits WHERE app = ?", (app,)))
+
+    def set_setting(self, key, value):
+        with self.lock:
+            self.settings[key] = value
+            self.pending_ops.append(("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                                     (key, json.dumps(value))))
+
+    def clear(self):
+        # Rare and explicitly confirmed by the user, so done synchronously
+        # rather than teaching every read to hide rows a pending clear drops.
+        self.flush()
+        with self.io_lock, self.lock, self.conn:
+            self.pending_usage.clear()
+            self.pending_titles.clear()
+            self.pending_sessions = []
+            for table in ('usage', 'app_totals', 'day_totals', 'sessions', 'hourly', 'title_usage', 'limits'):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute("DELETE FROM settings WHERE key = 'session_floor'")
+            self.settings.pop('session_floor', None)
+            self.limits.clear()
+            self.daily.clear()
+
+    def downsample(self, session_cutoff, hourly_cutoff):
+        # Like clear, done in one synchronous transaction: sessions before the
+        # cutoff are bucketed by hour and replaced by whatever is left of them.
+        self.flush()
+        with self.io_lock, self.lock, self.conn:
+            old = self.conn.execute("SELECT app, start, end FROM sessions WHERE start < ?",
+                                    (session_cutoff,)).fetchall()
+            buckets = defaultdict(float)
+            remainders = []
+            for app, start, end in old:
+                for hour, seconds in split_hours(start, min(end, session_cutoff)):
+                    buckets[(hour, app)] += seconds
+                if end > session_cutoff:
+                    remainders.append((app, session_cutoff, end))
+            self.conn.executemany("""
+                INSERT INTO hourly (hour, app, seconds) VALUES (?, ?, ?)
+                ON CONFLICT (hour, app) DO UPDATE SET seconds = seconds + excluded.seconds
+            """, [(hour, app, seconds) for (hour, app), seconds in buckets.items()])
+            self.conn.execute("DELETE FROM sessions WHERE start < ?", (session_cutoff,))
+            self.conn.executemany("INSERT INTO sessions (app, start, end) VALUES (?, ?, ?)", remainders)
+            self.conn.execute("DELETE FROM hourly WHERE hour < ?", (hourly_cutoff,))
+            self.conn.execute("DELETE FROM title_usage WHERE day < ?",
+                              (datetime.fromtimestamp(hourly_cutoff).strftime("%Y-%m-%d"),))
+            floor = max(self.session_floor, session_cutoff)
+            self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('session_floor', ?)",
+                              (json.dumps(floor),))
+            self.settings['session_floor'] = floor
+
+    def take_pending(self):
+        with self.lock:
+            if not (self.pending_usage or self.pending_sessions or self.pending_ops or self.pending_titles):
+                return None
+            batch = (tuple(self.pending_usage.items()), tuple(self.pending_sessions), tuple(self.pending_ops),
+                     tuple(self.pending_titles.items()))
+            self.pending_usage = defaultdict(float)
+            self.pending_titles = defaultdict(float)
+            self.pending_sessions = []
+            self.pending_ops = []
+            self.inflight.append(batch)
+            return batch
+
+    def write_batch(self, batch):
+        if not batch:
+            return 0
+        usage, sessions, ops, titles = batch
+        rows = [(day, app, seconds) for (day, app), seconds in usage]
+        with self.io_lock, self.lock:
+            with self.conn:
+                self._write_rows(rows)
+                self.conn.executemany("INSERT INTO sessions (app, start, end) VALUES (?, ?, ?)", sessions)
+                self.conn.executemany("""
+                    INSERT INTO title_usage (day, app, title, seconds) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (day, app, title) DO UPDATE SET seconds = seconds + excluded.seconds
+                """, [key + (seconds,) for key, seconds in titles])
+                for sql, params in ops:
+                    self.conn.execute(sql, params)
+            self.inflight.remove(batch)
+        return len(rows) + len(sessions) + len(ops) + len(titles)
+
+    def flush(self):
+        return self.write_batch(self.take_pending())
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+
+def open_store(kind, directory, legacy_file=None):
+    if kind == 'sqlite':
+        return SqliteStore(os.path.join(directory, DATABASE_NAME),
+                           legacy_dir=directory, legacy_file=legacy_file)
+    return UsageLog(directory, legacy_file=legacy_file)
@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Timer:
+    __slots__ = ('due', 'interval', 'callback', 'generation', 'cancelled')
+
+    def __init__(self, due, interval, callback):
+        self.due = due
+        self.interval = interval
+        self.callback = callback
+        self.generation = 0
+        self.cancelled = False
+
+
+class TimerQueue:
+    """One heap of cancellable, reschedulable timers, run from one thread.
+
+    Break reminders, limit warnings and periodic saves all register here
+    instead of sleeping on threads of their own. Cancelling or rescheduling
+    bumps the timer's generation, so the old heap entry goes stale
+    immediately and is dropped when it reaches the top. A waiting worker is
+    woken whenever the earliest deadline changes. Repeating timers advance
+    from their previous due time, so they don't drift.
+
+    Without ``start`` nothing runs on its own; call ``run_due`` to drive the
+    queue, e.g. from a headless tracker with a simulated clock.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.counter = itertools.count()
+        self.stale = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.errors = 0
+        self.last_error = None
+
+    def schedule(self, delay, callback, interval=None):
+        timer = Timer(self.clock() + delay, interval, callback)
+        with self.condition:
+            self._push(timer)
+        return timer
+
+    def reschedule(self, timer, delay, interval=None):
+        with self.condition:
+            self._retire(timer)
+            timer.cancelled = False
+            timer.due = self.clock() + delay
+            if interval is not None:
+                timer.interval = interval
+            self._push(timer)
+
+    def cancel(self, timer):
+        if timer is None:
+            return
+        with self.condition:
+            self._retire(timer)
+            timer.cancelled = True
+
+    def _retire(self, timer):
+        if not timer.cancelled:
+            self.stale += 1
+        timer.generation += 1
+        if self.stale > 64 and self.stale * 2 > len(self.heap):
+            # Rebuild rather than let stale entries pile up behind
+            # far-future deadlines that keep getting rescheduled.
+            self.heap = [entry for entry in self.heap
+                         if not entry[3].cancelled and entry[2] == entry[3].generation]
+            heapq.heapify(self.heap)
+            self.stale = 0
+
+    def _push(self, timer):
+        heapq.heappush(self.heap, (timer.due, next(self.counter), timer.generation, timer))
+        if self.heap[0][3] is timer:
+            self.condition.notify()
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, generation, timer = heapq.heappop(self.heap)
+            if timer.cancelled or generation != timer.generation:
+                continue
+            due.append(timer)
+            if timer.interval:
+                timer.due += timer.interval
+                if timer.due <= now:
+                    timer.due = now + timer.interval
+                self._push(timer)
+            else:
+                timer.cancelled = True
+        return due
+
+    def run_due(self):
+        with self.condition:
+            due = self._pop_due(self.clock())
+        for timer in due:
+            self._fire(timer)
+        return len(due)
+
+    def _fire(self, timer):
+        try:
+            timer.callback()
+        except Exception as e:
+            self.errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    now = self.clock()
+                    due = self._pop_due(now)
+                    if due:
+                        break
+                    timeout = self.heap[0][0] - now if self.heap else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+            for timer in due:
+                self._fire(timer)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def __len__(self):
+        with self.condition:
+            return sum(1 for _, _, generation, timer in self.heap
+                       if not timer.cancelled and generation == timer.generation)
+
+    def stats(self):
+        return {
+            'pending': len(self),
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
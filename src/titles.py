@@ -0,0 +1,154 @@
+import re
+from array import array
+
+OTHER_TITLE = "other"
+# (pattern, replacement) pairs applied in order. The defaults drop unread
+# counters like "(3) Inbox", the trailing " - App Name" most windows add,
+# and digits, so one document or page keeps one key while it's edited.
+DEFAULT_TITLE_RULES = [
+    [r"^\(\d+\)\s*", ""],
+    [r"\s+[-–—|]\s+[^-–—|]*$", ""],
+    [r"\d+", "#"],
+    [r"\s+", " "],
+]
+DEFAULT_TITLE_CAP = 200
+DEFAULT_TITLE_MIN_SECONDS = 60
+MAX_TITLE_LENGTH = 80
+
+
+def check_title_setting(key, value):
+    """Validates a ``title_rules`` or ``title_cap`` setting before it's
+    stored, returning it as the tracker will use it. Raises ValueError
+    naming the first bad rule; other keys pass through unchanged.
+    """
+    if key == 'title_cap':
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError("title_cap must be a positive whole number")
+        return value
+    if key != 'title_rules':
+        return value
+    if not isinstance(value, list):
+        raise ValueError("title_rules must be a list of [pattern, replacement] pairs")
+    rules = []
+    for number, rule in enumerate(value, 1):
+        if (not isinstance(rule, (list, tuple)) or len(rule) != 2
+                or not all(isinstance(part, str) for part in rule)):
+            raise ValueError(f"rule {number}: expected [pattern, replacement]")
+        try:
+            re.compile(rule[0]).sub(rule[1], "")
+        except re.error as e:
+            raise ValueError(f"rule {number}: {e}")
+        rules.append([rule[0], rule[1]])
+    return rules
+
+
+class TitleNormalizer:
+    """Rewrites raw window titles into stable keys with regex rules."""
+
+    def __init__(self, rules=DEFAULT_TITLE_RULES, max_length=MAX_TITLE_LENGTH):
+        self.rules = [(re.compile(pattern), replacement) for pattern, replacement in rules]
+        self.max_length = max_length
+        self.last = None
+        self.last_key = ""
+
+    def normalize(self, title):
+        # Titles rarely change between two samples, so the last one is kept.
+        if title == self.last:
+            return self.last_key
+        key = title or ""
+        for pattern, replacement in self.rules:
+            key = pattern.sub(replacement, key)
+        key = key.strip()[:self.max_length]
+        self.last, self.last_key = title, key
+        return key
+
+
+class CountMinSketch:
+    """Approximate per-key sums in ``depth`` rows of ``width`` counters.
+
+    Estimates never undercount, and overcount by at most a small fraction
+    of the total; memory is fixed however many distinct keys are added.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.clear()
+
+    def clear(self):
+        self.rows = [array('d', bytes(8 * self.width)) for _ in range(self.depth)]
+
+    def add(self, key, value):
+        # Returns the updated estimate for ``key``.
+        estimate = None
+        for seed, row in enumerate(self.rows):
+            i = hash((seed, key)) % self.width
+            row[i] += value
+            if estimate is None or row[i] < estimate:
+                estimate = row[i]
+        return estimate
+
+
+class TitleTracker:
+    """Decides which (app, title) keys get time of their own each day.
+
+    A title is admitted once its estimated time that day reaches
+    ``min_seconds``, for at most ``cap`` keys a day; everything else is
+    recorded under "other" for its app. The estimate comes from a
+    count-min sketch, so the one-off titles that come and go all day cost
+    no memory, and at most ``cap`` keys per day ever reach the store.
+    Time a title spent before it was admitted stays in "other".
+
+    Keys already stored for the day (after a restart) are passed to
+    ``seed`` once the history is loaded; until then the cap only counts
+    keys admitted since.
+    """
+
+    def __init__(self, rules=DEFAULT_TITLE_RULES, cap=DEFAULT_TITLE_CAP,
+                 min_seconds=DEFAULT_TITLE_MIN_SECONDS):
+        self.normalizer = TitleNormalizer(rules)
+        self.rules = rules
+        self.cap = cap
+        self.min_seconds = min_seconds
+        self.sketch = CountMinSketch()
+        self.day = None
+        self.admitted = set()
+        self.overflow = 0
+
+    def normalize(self, title):
+        return self.normalizer.normalize(title)
+
+    def seed(self, day, keys):
+        if day != self.day:
+            self.start_day(day)
+        self.admitted.update(keys)
+
+    def start_day(self, day):
+        self.day = day
+        self.sketch.clear()
+        self.admitted = set()
+
+    def attribute(self, day, app, title, seconds):
+        """Returns the title to record ``seconds`` of ``app`` under."""
+        if day != self.day:
+            if self.day and day < self.day:
+                # The tail of yesterday, recorded just after midnight.
+                return OTHER_TITLE
+            self.start_day(day)
+        key = (app, title)
+        if key in self.admitted:
+            return title
+        estimate = self.sketch.add(key, seconds)
+        if estimate >= self.min_seconds and len(self.admitted) < self.cap and title:
+            self.admitted.add(key)
+            return title
+        self.overflow += 1
+        return OTHER_TITLE
+
+    def stats(self):
+        return {
+            'day': self.day,
+            'admitted': len(self.admitted),
+            'cap': self.cap,
+            'overflow_samples': self.overflow,
+        }
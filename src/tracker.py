@@ -0,0 +1,436 @@
+import re
+import threading
+from datetime import datetime
+
+from categories import CATEGORY_PREFIX, Categorizer
+from limits import LimitEngine
+from persistence import PersistenceWorker
+from ranking import TopN
+from retention import RetentionJob
+from scheduler import SampleScheduler
+from sessions import IntervalIndex
+from timers import TimerQueue
+from titles import DEFAULT_TITLE_CAP, DEFAULT_TITLE_RULES, OTHER_TITLE, TitleTracker, check_title_setting
+
+
+class UsageTracker:
+    """The sampling loop: probe, accumulate, check limits, persist.
+
+    Holds no Tk state, so it runs the same under the GUI, headless, or
+    driven tick by tick from a benchmark with a synthetic or replay probe.
+    Periodic saves and limit deadlines are timers on ``timers``; when that
+    queue has no thread of its own, each tick runs whatever is due.
+    With ``metrics``, ticks, probes and saves are timed and errors counted.
+    """
+
+    def __init__(self, store, probe, clock=datetime.now, scheduler=None, on_limit=None,
+                 channel=None, timers=None, save_interval=30, metrics=None):
+        self.store = store
+        self.probe = probe
+        self.clock = clock
+        self.scheduler = scheduler or SampleScheduler()
+        self.timers = timers or TimerQueue(clock=self.scheduler.monotonic)
+        self.save_timer = None
+        self.on_limit = on_limit
+        self.channel = channel
+        self.published_top = None
+        self.save_interval = save_interval
+        self.current_app = ""
+        self.current_title = ""
+        # Set while per-title tracking is on; see update_titles.
+        self.title_tracker = None
+        self.sessions = IntervalIndex()
+        self.sessions_saved = 0
+        self.sessions_lock = threading.Lock()
+        self.loaded_sessions = None
+        self.loaded_skip = 0
+        # Set once past sessions are in self.sessions.
+        self.history_merged = threading.Event()
+        self.clears = 0
+        self.metrics = metrics
+        self.writer = PersistenceWorker(store, metrics=metrics)
+        self.top_apps = TopN(8, store.app_total)
+        self.limits = LimitEngine(self.limit_usage_of, self.limit_reached, self.timers, clock=clock)
+        # Budgets for whole categories are limits named "@Category"; they get
+        # an engine of their own, focused on the current app's category.
+        self.categories = Categorizer()
+        # Lifetime and today's seconds per category, kept up as usage is
+        # recorded; None until seed_category_totals runs on the tracker thread.
+        self.category_totals = None
+        self.category_day = None
+        self.category_limits = LimitEngine(self.category_usage_of, self.limit_reached, self.timers, clock=clock)
+        self.retention = RetentionJob(store, self.timers, clock=clock, on_downsample=self.trim_sessions)
+        self.app_limits = {}
+        self.is_tracking = True
+        if metrics:
+            metrics.add_source('scheduler', self.scheduler.stats)
+            metrics.add_source('writer', self.writer.stats)
+            metrics.add_source('timers', self.timers.stats)
+            metrics.add_source('top_apps_cache', self.top_apps.stats)
+            metrics.add_source('category_cache', lambda: self.categories.stats())
+            metrics.add_source('titles', lambda: self.title_tracker.stats() if self.title_tracker else {})
+            cache = getattr(probe, 'name_cache', None)
+            if cache:
+                metrics.add_source('process_cache', cache.stats)
+
+    def load_data(self, lazy=False):
+        # With lazy, the store starts from its summary and past sessions are
+        # read on a background thread, then merged in by the next tick.
+        self.store.load(lazy=lazy)
+        self.app_limits = self.store.app_limits
+        self.top_apps.seed(self.store.top_apps(self.top_apps.n))
+        if lazy:
+            threading.Thread(target=self.load_sessions, daemon=True).start()
+        else:
+            self.load_sessions()
+            self.merge_sessions()
+        # Saving must not depend on the settings below being usable.
+        self.writer.start()
+        self.save_timer = self.timers.schedule(self.save_interval, self.save_data, interval=self.save_interval)
+        self.retention.start()
+        self.update_limits()
+        self.update_titles()
+
+    def load_sessions(self):
+        clears = self.clears
+        self.store.history_loaded.wait()
+        # Roll anything past session retention into hourly buckets first, so
+        # only the window the limits and analytics read is held in memory.
+        self.retention.run()
+        floor = self.store.session_floor
+        with self.sessions_lock:
+            # The first ``skip`` sessions we hold are already in what the
+            # store returns; saves can't slip in between the two.
+            stored = self.store.sessions()
+            skip = self.sessions_saved
+        history = IntervalIndex()
+        # Imported sessions from other machines needn't be in time order.
+        stored.sort(key=lambda session: session[1])
+        for app, start, end in stored:
+            if end > floor:
+                history.add(app, start, end)
+        history.seal()
+        if clears == self.clears:
+            self.loaded_skip = skip
+            self.loaded_sessions = history
+
+    def merge_sessions(self):
+        # Runs on the tracker thread, the only one that adds to self.sessions.
+        with self.sessions_lock:
+            history, self.loaded_sessions = self.loaded_sessions, None
+            saved = len(history) + self.sessions_saved - self.loaded_skip
+            for app, start, end in self.sessions.closed_sessions(self.loaded_skip, include_open=True):
+                history.add(app, start, end)
+            self.sessions = history
+            self.sessions_saved = saved
+        self.history_merged.set()
+        if self.title_tracker:
+            self.seed_titles(self.title_tracker)
+        self.limits.resync()
+        self.category_limits.resync()
+
+    def trim_sessions(self, before):
+        # On the retention thread, after sessions before ``before`` went into
+        # hourly buckets. Only saved sessions go, and only while no load is
+        # pending, since merge_sessions counts positions in the index.
+        with self.sessions_lock:
+            if self.history_merged.is_set() and self.loaded_sessions is None:
+                self.sessions_saved -= self.sessions.trim(before, self.sessions_saved)
+
+    def reload(self):
+        # After history was merged in from outside (an import): re-read what
+        # the in-memory views were built from.
+        self.top_apps.seed(self.store.top_apps(self.top_apps.n))
+        self.history_merged.clear()
+        threading.Thread(target=self.load_sessions, daemon=True).start()
+        self.publish_all()
+
+    def save_data(self, final=False):
+        # Called from both the tracker and the Tk thread; the write itself
+        # happens on the persistence worker.
+        with self.sessions_lock:
+            closed = self.sessions.closed_sessions(self.sessions_saved, include_open=final)
+            self.store.add_sessions(closed)
+            self.sessions_saved += len(closed)
+        self.writer.request_save()
+
+    def clear_data(self):
+        self.clears += 1
+        self.loaded_sessions = None
+        self.store.clear()
+        with self.sessions_lock:
+            self.sessions.clear()
+            self.sessions_saved = 0
+        self.top_apps.clear()
+        self.save_data()
+        self.update_limits()
+        self.publish_all()
+
+    def track_usage(self):
+        while self.is_tracking:
+            self.tick()
+            if not self.scheduler.wait():
+                break
+
+    def tick(self):
+        metrics = self.metrics
+        if metrics:
+            started = metrics.clock()
+            expected = self.scheduler.expected
+        try:
+            if self.loaded_sessions is not None:
+                self.merge_sessions()
+            if self.category_totals is None and self.history_merged.is_set():
+                self.seed_category_totals()
+            if metrics:
+                probed = metrics.clock()
+                current_app = self.probe.get_active_window()
+                metrics.observe('probe', metrics.clock() - probed)
+            else:
+                current_app = self.probe.get_active_window()
+            current_time = self.clock()
+            elapsed = self.scheduler.mark(current_time)
+            if metrics and elapsed is not None:
+                # How far off its deadline this sample came.
+                metrics.observe('tick_jitter', abs(elapsed - expected))
+            previous_app, previous_title = self.current_app, self.current_title
+            current_title = self.title_tracker.normalize(self.probe.title) if self.title_tracker else None
+            switched = current_app != previous_app
+            touched = []
+            touched_categories = []
+            if elapsed is None:
+                # First sample, or waking up after sleep/suspend: nothing to
+                # credit, the next session must not merge across the gap, and
+                # limit deadlines are recomputed from what was recorded.
+                self.sessions.seal()
+                self.limits.resync()
+                self.category_limits.resync()
+            elif current_app:
+                if switched and previous_app:
+                    # The switch happened somewhere since the last sample;
+                    # split the difference rather than give it all to one app.
+                    half = elapsed / 2
+                    touched_categories = [
+                        self.record_usage(previous_app, current_time.timestamp() - half, half, previous_title),
+                        self.record_usage(current_app, current_time.timestamp(), half, current_title)]
+                    touched = [previous_app, current_app]
+                else:
+                    touched_categories = [
+                        self.record_usage(current_app, current_time.timestamp(), elapsed, current_title)]
+                    touched = [current_app]
+            self.limits.focus(current_app)
+            self.category_limits.focus(self.category_key(current_app, current_title))
+            self.current_app = current_app
+            self.current_title = current_title
+            if self.channel:
+                self.publish_changes(current_time, switched, touched, touched_categories)
+            self.scheduler.adapt(switched, self.probe.idle_seconds())
+            if not self.timers.running:
+                self.timers.run_due()
+        except Exception as e:
+            if metrics:
+                metrics.error('tick', e)
+        if metrics:
+            metrics.observe('tick', metrics.clock() - started)
+
+    def record_usage(self, app, end, seconds, title=None):
+        # Returns the "@Category" key the time counted towards, if any.
+        # ``title`` is the normalized window title, while titles are tracked.
+        day = datetime.fromtimestamp(end).strftime("%Y-%m-%d")
+        self.store.add_usage(day, app, seconds)
+        category = self.categories.category(app, title)
+        tracker = self.title_tracker
+        if tracker and title is not None:
+            recorded = tracker.attribute(day, app, title, seconds)
+            if recorded == OTHER_TITLE and category and category != self.categories.category(app):
+                # Overflow a title rule matched: keep which category it went
+                # to, so seed_category_totals can count it again.
+                recorded = f"{OTHER_TITLE} {CATEGORY_PREFIX}{category}"
+            self.store.add_title_usage(day, app, recorded, seconds)
+        self.top_apps.add(app, seconds)
+        self.sessions.add(app, end - seconds, end)
+        today = self.category_day
+        if today is not None and day > today[0]:
+            today = self.category_day = (day, {})
+        if not category:
+            return None
+        totals = self.category_totals
+        if totals is not None:
+            totals[category] = totals.get(category, 0.0) + seconds
+        if today is not None and day == today[0]:
+            today[1][category] = today[1].get(category, 0.0) + seconds
+        return CATEGORY_PREFIX + category
+
+    def publish_changes(self, current_time, switched, touched, touched_categories=()):
+        changes = {}
+        if switched:
+            changes['current_app'] = self.current_app
+        if touched:
+            changes['today_total'] = self.store.day_total(current_time.strftime("%Y-%m-%d"))
+            limited = [app for app in touched if app in self.app_limits]
+            limited += [key for key in touched_categories if key in self.app_limits]
+            if limited:
+                changes['limit_usage'] = {app: self.limit_used(app) for app in limited}
+        if self.top_apps.version != self.published_top:
+            self.published_top = self.top_apps.version
+            changes['top_apps'] = tuple(self.top_apps.items())
+        if changes:
+            self.channel.publish(changes)
+
+    def publish_all(self):
+        if not self.channel:
+            return
+        self.published_top = self.top_apps.version
+        self.channel.publish(self.snapshot())
+
+    def snapshot(self):
+        return {
+            'current_app': self.current_app,
+            'today_total': self.store.day_total(self.clock().strftime("%Y-%m-%d")),
+            'top_apps': tuple(self.top_apps.items()),
+            'limit_usage': self.limit_usage(),
+        }
+
+    # --- Limits ---
+    def update_limits(self):
+        # Called after limits or category rules are edited; recomputes the
+        # focused app's deadlines.
+        rules = self.store.get_setting('category_rules') or []
+        if rules != self.categories.rules:
+            try:
+                self.categories = Categorizer(rules)
+            except re.error as e:
+                # Rules saved before parse_rules checked them as a whole;
+                # run without categories rather than not at all.
+                self.categories = Categorizer()
+                if self.metrics:
+                    self.metrics.error('category_rules', e)
+        # Recounted by the next tick, on the tracker thread.
+        self.category_totals = None
+        app_limits, category_limits = {}, {}
+        for app, minutes in list(self.app_limits.items()):
+            (category_limits if app.startswith(CATEGORY_PREFIX) else app_limits)[app] = minutes
+        self.limits.set_limits(app_limits, self.store.daily_limits)
+        self.category_limits.set_limits(category_limits, self.store.daily_limits)
+        if self.channel:
+            self.channel.publish({'limit_usage': self.limit_usage()})
+
+    # --- Window titles ---
+    def update_titles(self):
+        # Called after the title settings change. Titles are only read from
+        # the probe while tracking them is switched on.
+        enabled = bool(self.store.get_setting('title_tracking'))
+        rules = self.store.get_setting('title_rules') or DEFAULT_TITLE_RULES
+        cap = self.store.get_setting('title_cap') or DEFAULT_TITLE_CAP
+        try:
+            rules = check_title_setting('title_rules', rules)
+            cap = check_title_setting('title_cap', cap)
+        except ValueError as e:
+            # Settings stored before they were checked; track with the
+            # defaults rather than fail every load.
+            rules, cap = DEFAULT_TITLE_RULES, DEFAULT_TITLE_CAP
+            if self.metrics:
+                self.metrics.error('title_rules', e)
+        self.probe.titles = enabled
+        if not enabled:
+            self.title_tracker = None
+            return
+        tracker = self.title_tracker
+        if tracker is None or tracker.rules != rules or tracker.cap != cap:
+            tracker = TitleTracker(rules, cap)
+            if self.history_merged.is_set():
+                self.seed_titles(tracker)
+            self.title_tracker = tracker
+        # Title rules only match while titles are read.
+        self.category_totals = None
+
+    def seed_titles(self, tracker):
+        # Keys already stored today (before a restart) keep counting against
+        # the cap. Only called once the history is in, so this doesn't wait.
+        day = self.clock().strftime("%Y-%m-%d")
+        tracker.seed(day, [(app, title) for app, titles in self.store.title_usage(day, day).items()
+                           for title in titles if not title.startswith(OTHER_TITLE)])
+
+    def limit_usage(self):
+        return {app: self.limit_used(app) for app in list(self.app_limits)}
+
+    def limit_used(self, app):
+        if app.startswith(CATEGORY_PREFIX):
+            return self.category_limits.usage(app)
+        return self.limits.usage(app)
+
+    def category_key(self, app, title=None):
+        category = self.categories.category(app, title)
+        return CATEGORY_PREFIX + category if category else None
+
+    def limit_usage_of(self, app, since):
+        if since is None:
+            return self.store.app_total(app)
+        return self.sessions.total(since, float('inf'), app)
+
+    def seed_category_totals(self):
+        # Once per rules, limits or title setting change (and after a clear
+        # or import), on the tracker thread with the history loaded. Lifetime
+        # totals start from the same per-app totals lifetime app limits use.
+        # Time recorded per window title is split by title, so title rules
+        # count too; plain "other" and untitled time go by app alone.
+        now = self.clock()
+        day = now.strftime("%Y-%m-%d")
+        midnight = datetime.combine(now.date(), datetime.min.time()).timestamp()
+        titled = self.title_tracker is not None and self.categories.has_titles
+        today = {app: self.sessions.total(midnight, float('inf'), app) for app in list(self.sessions.app_names)}
+        self.category_day = (day, self.category_sums(today, self.store.title_usage(day, day) if titled else {}))
+        self.category_totals = self.category_sums(self.store.app_totals(),
+                                                  self.store.title_usage(None, None) if titled else {})
+
+    def category_sums(self, app_seconds, title_usage):
+        categories = self.categories
+        overflow = f"{OTHER_TITLE} {CATEGORY_PREFIX}"
+        totals = {}
+        for app, seconds in app_seconds.items():
+            for title, part in title_usage.get(app, {}).items():
+                if title.startswith(overflow):
+                    category = title[len(overflow):]
+                else:
+                    category = categories.category(app, None if title == OTHER_TITLE else title)
+                if category:
+                    totals[category] = totals.get(category, 0.0) + part
+                seconds -= part
+            category = categories.category(app)
+            if category and seconds > 0:
+                totals[category] = totals.get(category, 0.0) + seconds
+        return totals
+
+    def category_usage_of(self, key, since):
+        category = key[len(CATEGORY_PREFIX):]
+        categories = self.categories
+        if since is None:
+            totals = self.category_totals
+            if totals is not None:
+                return totals.get(category, 0.0)
+            # Not counted yet: by app, from the per-app totals.
+            return sum(seconds for app, seconds in self.store.app_totals().items()
+                       if categories.category(app) == category)
+        today = self.category_day
+        if today is not None and self.category_totals is not None and \
+                datetime.strptime(today[0], "%Y-%m-%d").timestamp() == since:
+            return today[1].get(category, 0.0)
+        # Everything since midnight is in the session index.
+        return sum(self.sessions.total(since, float('inf'), app)
+                   for app in list(self.sessions.app_names) if categories.category(app) == category)
+
+    def limit_reached(self, app, limit, daily):
+        if self.channel:
+            self.channel.publish({'limit_warnings': [(app, limit, daily)]})
+        elif self.on_limit:
+            self.on_limit(app, limit, daily)
+
+    def stop(self):
+        self.is_tracking = False
+        self.scheduler.stop()
+        self.timers.cancel(self.save_timer)
+        self.retention.stop()
+        self.save_data(final=True)
+        self.writer.flush()
+        self.probe.close()
+        self.store.close()
@@ -0,0 +1,313 @@
+"""Streaming export and import of usage history.
+
+Exports are NDJSON or CSV, gzip- or zstd-compressed by file suffix
+(``.ndjson``, ``.csv``, ``.ndjson.gz``, ``.csv.zst``...). Rows are written
+as the store yields them, so memory stays flat however much history there
+is. ``source`` rows name the machine the rows after them were first
+recorded on: this machine for its own time, and the original machine for
+anything it imported, so history passed along from machine to machine
+keeps its origin. The importer uses that to merge several machines'
+exports, or several exports of one machine over time, without counting
+anything twice; see ImportLedger.
+
+Run from src/ while the app and collector are closed::
+
+    python -m transfer export history.ndjson.gz --from 2026-01-01 --app code.exe
+    python -m transfer import laptop.ndjson.gz desktop.csv
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime
+
+from storage import open_store
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LEDGER_NAME = "imports.db"
+CSV_FIELDS = ['type', 'day', 'app', 'seconds', 'start', 'end', 'minutes', 'daily']
+
+
+def machine_id(store):
+    source = store.get_setting('machine_id')
+    if not source:
+        source = uuid.uuid4().hex
+        store.set_setting('machine_id', source)
+    return source
+
+
+def _is_csv(path):
+    name = path.lower()
+    for suffix in ('.gz', '.zst'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name.endswith('.csv')
+
+
+def open_stream(path, mode, name=None):
+    """Opens ``path`` as text for 'r' or 'w', compressed according to the
+    suffix of ``name`` (default: the path itself)."""
+    name = (name or path).lower()
+    if name.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    if name.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("zstd files need the zstandard package")
+        if mode == 'w':
+            raw = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+        else:
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def iter_history(store, start_day=None, end_day=None, apps=None, ledger=None):
+    """Yields export rows (dicts) straight off the store's iterators.
+
+    With the ``ledger`` of this data directory, imported time and sessions
+    are exported under the machine they came from rather than this one.
+    """
+    own = machine_id(store)
+    current = own
+    yield {'type': 'source', 'app': own}
+    for app, minutes in list(store.app_limits.items()):
+        if apps is None or app in apps:
+            yield {'type': 'limit', 'app': app, 'minutes': minutes, 'daily': app in store.daily_limits}
+    for day, app, seconds in store.iter_usage(start_day, end_day):
+        if apps is not None and app not in apps:
+            continue
+        for origin, imported in (ledger.origins(day, app) if ledger else ()):
+            if origin == own:
+                continue
+            if origin != current:
+                current = origin
+                yield {'type': 'source', 'app': origin}
+            yield {'type': 'usage', 'day': day, 'app': app, 'seconds': imported}
+            seconds -= imported
+        if seconds > 1e-6:
+            if current != own:
+                current = own
+                yield {'type': 'source', 'app': own}
+            yield {'type': 'usage', 'day': day, 'app': app, 'seconds': seconds}
+    for app, start, end in store.iter_sessions():
+        if apps is not None and app not in apps:
+            continue
+        day = datetime.fromtimestamp(start).strftime("%Y-%m-%d")
+        if (start_day and day < start_day) or (end_day and day > end_day):
+            continue
+        origin = (ledger.session_origin(app, start, end) if ledger else None) or own
+        if origin != current:
+            current = origin
+            yield {'type': 'source', 'app': origin}
+        yield {'type': 'session', 'day': day, 'app': app, 'start': start, 'end': end}
+
+
+def export_history(store, path, start_day=None, end_day=None, apps=None, ledger=None):
+    count = 0
+    tmp_path = path + ".tmp"
+    with open_stream(tmp_path, 'w', name=path) as f:
+        if _is_csv(path):
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: f.write(json.dumps(row, separators=(',', ':')) + '\n')
+        for row in iter_history(store, start_day, end_day, apps, ledger):
+            write(row)
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_history(path):
+    """Yields rows from an export, with numbers parsed back from CSV."""
+    with open_stream(path, 'r') as f:
+        if not _is_csv(path):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        for row in csv.DictReader(f):
+            row = {field: value for field, value in row.items() if value != ''}
+            for field in ('seconds', 'start', 'end'):
+                if row.get(field):
+                    row[field] = float(row[field])
+            if row.get('minutes'):
+                row['minutes'] = int(row['minutes'])
+            row['daily'] = row.get('daily') == 'True'
+            yield row
+
+
+class ImportLedger:
+    """What has been imported so far, per source machine, in SQLite.
+
+    For each (source, day, app) the ledger keeps the seconds already merged,
+    so re-importing an export only adds whatever has grown since. Each
+    session taken is kept by (app, start, end) with the machine it came
+    from, so the same session arriving again, from that machine or passed
+    along by another, is skipped whatever order the export lists it in.
+    Being a table, it stays on disk no matter how much has been imported.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS imported_usage (
+                    source TEXT NOT NULL, day TEXT NOT NULL, app TEXT NOT NULL,
+                    seconds REAL NOT NULL,
+                    PRIMARY KEY (source, day, app)
+                );
+                CREATE INDEX IF NOT EXISTS imported_usage_day ON imported_usage (day, app);
+                CREATE TABLE IF NOT EXISTS imported_session_keys (
+                    app TEXT NOT NULL, start REAL NOT NULL, end REAL NOT NULL,
+                    source TEXT NOT NULL,
+                    PRIMARY KEY (app, start, end)
+                );
+                -- Per-day session counts from before sessions were keyed.
+                DROP TABLE IF EXISTS imported_sessions;
+            """)
+
+    def usage(self, source, day, app):
+        row = self.conn.execute("SELECT seconds FROM imported_usage WHERE source = ? AND day = ? AND app = ?",
+                                (source, day, app)).fetchone()
+        return row[0] if row else 0.0
+
+    def set_usage(self, source, day, app, seconds):
+        self.conn.execute("INSERT OR REPLACE INTO imported_usage VALUES (?, ?, ?, ?)", (source, day, app, seconds))
+
+    def origins(self, day, app):
+        """(source, seconds) imported for ``app`` on ``day``."""
+        return self.conn.execute("SELECT source, seconds FROM imported_usage WHERE day = ? AND app = ?",
+                                 (day, app)).fetchall()
+
+    def session_origin(self, app, start, end):
+        row = self.conn.execute("SELECT source FROM imported_session_keys WHERE app = ? AND start = ? AND end = ?",
+                                (app, start, end)).fetchone()
+        return row[0] if row else None
+
+    def add_session(self, source, app, start, end):
+        """Records a session as imported; False if it already was."""
+        cursor = self.conn.execute("INSERT OR IGNORE INTO imported_session_keys VALUES (?, ?, ?, ?)",
+                                   (app, start, end, source))
+        return cursor.rowcount > 0
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM imported_usage")
+            self.conn.execute("DELETE FROM imported_session_keys")
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def forget_imports(store, data_dir):
+    """Call after clearing the store: what the ledger says was imported is
+    gone, so it's emptied, and this machine takes a new id so its own
+    earlier exports import like any other machine's, i.e. as a restore."""
+    store.set_setting('machine_id', uuid.uuid4().hex)
+    ledger = ImportLedger(os.path.join(data_dir, LEDGER_NAME))
+    try:
+        ledger.clear()
+    finally:
+        ledger.close()
+
+
+def import_history(store, path, ledger, flush=None, batch=1000):
+    """Merges an export into ``store``. Returns counts of what was added.
+
+    The ledger is committed only after ``flush`` (default: ``store.flush``)
+    has written the merged data, so a crash can't leave rows recorded as
+    imported that never reached the store.
+    """
+    own = machine_id(store)
+    stats = {'usage': 0, 'sessions': 0, 'limits': 0, 'skipped': 0}
+    source = os.path.basename(path)
+    sessions = []
+    for row in read_history(path):
+        kind = row.get('type')
+        if kind == 'source':
+            source = row['app']
+            continue
+        if source == own:
+            # Our own export since the last clear: everything in it is
+            # already here.
+            stats['skipped'] += 1
+            continue
+        if kind == 'usage':
+            previous = ledger.usage(source, row['day'], row['app'])
+            if row['seconds'] > previous:
+                store.add_usage(row['day'], row['app'], row['seconds'] - previous)
+                ledger.set_usage(source, row['day'], row['app'], row['seconds'])
+                stats['usage'] += 1
+            else:
+                stats['skipped'] += 1
+        elif kind == 'session':
+            if ledger.add_session(source, row['app'], row['start'], row['end']):
+                sessions.append((row['app'], row['start'], row['end']))
+                if len(sessions) >= batch:
+                    store.add_sessions(sessions)
+                    stats['sessions'] += len(sessions)
+                    sessions = []
+            else:
+                stats['skipped'] += 1
+        elif kind == 'limit':
+            if row['app'] not in store.app_limits:
+                store.set_limit(row['app'], int(row['minutes']), daily=bool(row.get('daily')))
+                stats['limits'] += 1
+    if sessions:
+        store.add_sessions(sessions)
+        stats['sessions'] += len(sessions)
+    (flush or store.flush)()
+    ledger.commit()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import Tesseract usage history")
+    parser.add_argument('--storage', choices=['log', 'sqlite'], default='log',
+                        help="usage store backend (default: log)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="write history to an .ndjson/.csv file, optionally .gz/.zst")
+    export.add_argument('path')
+    export.add_argument('--from', dest='start_day', help="first day to include (YYYY-MM-DD)")
+    export.add_argument('--to', dest='end_day', help="last day to include (YYYY-MM-DD)")
+    export.add_argument('--app', action='append', dest='apps', help="only this app (repeatable)")
+    merge = commands.add_parser('import', help="merge exports into the local history")
+    merge.add_argument('paths', nargs='+')
+    args = parser.parse_args(argv)
+
+    data_dir = "tesseract_data"
+    store = open_store(args.storage, data_dir, legacy_file="tesseract_data.json")
+    store.load()
+    ledger = ImportLedger(os.path.join(data_dir, LEDGER_NAME))
+    try:
+        if args.command == 'export':
+            apps = set(args.apps) if args.apps else None
+            count = export_history(store, args.path, args.start_day, args.end_day, apps, ledger)
+            print(f"Exported {count} rows to {args.path}")
+        else:
+            for path in args.paths:
+                stats = import_history(store, path, ledger)
+                print(f"{path}: {stats['usage']} usage rows, {stats['sessions']} sessions, "
+                      f"{stats['limits']} limits added; {stats['skipped']} already present")
+    finally:
+        ledger.close()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
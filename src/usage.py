@@ -0,0 +1,288 @@
+import heapq
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Interner:
+    """Maps app names to small integer ids, shared by every table of a state."""
+
+    __slots__ = ('ids', 'names')
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def id(self, name):
+        app_id = self.ids.get(name)
+        if app_id is None:
+            name = sys.intern(name)
+            app_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return app_id
+
+    def __len__(self):
+        return len(self.names)
+
+
+class _DayRow:
+    """One day's per-app seconds as two parallel typed arrays."""
+
+    __slots__ = ('apps', 'seconds')
+
+    def __init__(self):
+        self.apps = array('I')
+        self.seconds = array('d')
+
+    def add(self, app_id, seconds):
+        try:
+            self.seconds[self.apps.index(app_id)] += seconds
+        except ValueError:
+            self.apps.append(app_id)
+            self.seconds.append(seconds)
+
+
+class UsageTable:
+    """Usage seconds per app, per day and per (day, app), in typed arrays.
+
+    A day typically touches a few dozen of however many apps have ever been
+    seen, so each day keeps a short (app id, seconds) array pair instead of a
+    dict of boxed floats, and lifetime and daily totals are flat ``array('d')``
+    indexed by id. Totals are kept on their own rather than summed from the
+    rows: data migrated from the legacy format has lifetime totals with no
+    day breakdown. Aggregations use NumPy when it's installed.
+    """
+
+    __slots__ = ('interner', 'app_seconds', 'day_ids', 'day_seconds', 'rows')
+
+    def __init__(self, interner=None):
+        self.interner = Interner() if interner is None else interner
+        self.clear()
+
+    def clear(self):
+        self.app_seconds = array('d')
+        self.day_ids = {}
+        self.day_seconds = array('d')
+        self.rows = []
+
+    def _app(self, app):
+        app_id = self.interner.id(app)
+        if app_id >= len(self.app_seconds):
+            self.app_seconds.extend([0.0] * (app_id + 1 - len(self.app_seconds)))
+        return app_id
+
+    def _day(self, day):
+        day_id = self.day_ids.get(day)
+        if day_id is None:
+            day_id = self.day_ids[day] = len(self.rows)
+            self.day_seconds.append(0.0)
+            self.rows.append(_DayRow())
+        return day_id
+
+    def add(self, day, app, seconds):
+        app_id = self._app(app)
+        day_id = self._day(day)
+        self.app_seconds[app_id] += seconds
+        self.day_seconds[day_id] += seconds
+        self.rows[day_id].add(app_id, seconds)
+
+    def load(self, app_usage, daily_usage, day_apps):
+        for app, seconds in app_usage.items():
+            self.app_seconds[self._app(app)] += seconds
+        for day, seconds in daily_usage.items():
+            self.day_seconds[self._day(day)] += seconds
+        for day, apps in day_apps.items():
+            row = self.rows[self._day(day)]
+            for app, seconds in apps.items():
+                row.add(self._app(app), seconds)
+
+    # --- Queries ---
+    def app_total(self, app):
+        app_id = self.interner.ids.get(app)
+        if app_id is None or app_id >= len(self.app_seconds):
+            return 0
+        return self.app_seconds[app_id]
+
+    def day_total(self, day):
+        day_id = self.day_ids.get(day)
+        return 0 if day_id is None else self.day_seconds[day_id]
+
+    def app_totals(self):
+        names = self.interner.names
+        return {names[app_id]: seconds for app_id, seconds in enumerate(self.app_seconds) if seconds}
+
+    def day_totals(self):
+        return {day: self.day_seconds[day_id] for day, day_id in self.day_ids.items()}
+
+    def day_apps(self):
+        names = self.interner.names
+        return {day: {names[app_id]: seconds for app_id, seconds in zip(row.apps, row.seconds)}
+                for day, row in zip(self.day_ids, self.rows)}
+
+    def day_items(self, day):
+        day_id = self.day_ids.get(day)
+        if day_id is None:
+            return []
+        row = self.rows[day_id]
+        names = self.interner.names
+        return [(names[app_id], seconds) for app_id, seconds in zip(row.apps, row.seconds)]
+
+    def top_apps(self, n):
+        names = self.interner.names
+        top = heapq.nlargest(n, enumerate(self.app_seconds), key=lambda x: x[1])
+        return [(names[app_id], seconds) for app_id, seconds in top if seconds]
+
+    def usage_between(self, start_day, end_day, group_by='app', app=None):
+        # Days are inclusive; ``app`` restricts the sums to that one app.
+        days = [(day, day_id) for day, day_id in self.day_ids.items()
+                if not (start_day and day < start_day) and not (end_day and day > end_day)]
+        if app is not None:
+            app_id = self.interner.ids.get(app)
+            totals = {}
+            if app_id is None:
+                return totals
+            for day, day_id in days:
+                row = self.rows[day_id]
+                if app_id in row.apps:
+                    totals[day] = row.seconds[row.apps.index(app_id)]
+            if group_by == 'day':
+                return totals
+            return {app: sum(totals.values())} if totals else {}
+        if group_by == 'day':
+            return {day: self.day_seconds[day_id] for day, day_id in days if self.day_seconds[day_id]}
+        totals = self._sum_rows([self.rows[day_id] for _, day_id in days])
+        names = self.interner.names
+        return {names[app_id]: seconds for app_id, seconds in enumerate(totals) if seconds}
+
+    def _sum_rows(self, rows):
+        size = len(self.interner)
+        if numpy is not None and rows:
+            apps = numpy.concatenate([numpy.frombuffer(row.apps, dtype=f'u{row.apps.itemsize}') for row in rows])
+            seconds = numpy.concatenate([numpy.frombuffer(row.seconds, dtype='f8') for row in rows])
+            return numpy.bincount(apps, weights=seconds, minlength=size).tolist()
+        totals = [0.0] * size
+        for row in rows:
+            for app_id, seconds in zip(row.apps, row.seconds):
+                totals[app_id] += seconds
+        return totals
+
+
+class SessionTable:
+    """Focus sessions as three parallel arrays: app id, start and end."""
+
+    __slots__ = ('interner', 'apps', 'starts', 'ends')
+
+    def __init__(self, interner=None):
+        self.interner = Interner() if interner is None else interner
+        self.clear()
+
+    def clear(self):
+        self.apps = array('I')
+        self.starts = array('d')
+        self.ends = array('d')
+
+    def append(self, app, start, end):
+        self.apps.append(self.interner.id(app))
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def extend(self, sessions):
+        for app, start, end in sessions:
+            self.append(app, start, end)
+
+    def __len__(self):
+        return len(self.apps)
+
+    def split_before(self, cutoff):
+        """Removes and returns (app id, start, end) for the part of every
+        session before ``cutoff``; a session straddling it keeps the rest."""
+        before = []
+        apps, starts, ends = array('I'), array('d'), array('d')
+        for app_id, start, end in zip(self.apps, self.starts, self.ends):
+            if start < cutoff:
+                before.append((app_id, start, min(end, cutoff)))
+                start = cutoff
+            if end > start:
+                apps.append(app_id)
+                starts.append(start)
+                ends.append(end)
+        self.apps, self.starts, self.ends = apps, starts, ends
+        return before
+
+    def slice(self, start, stop):
+        names = self.interner.names
+        return [(names[app_id], session_start, session_end) for app_id, session_start, session_end
+                in zip(self.apps[start:stop], self.starts[start:stop], self.ends[start:stop])]
+
+    def __iter__(self):
+        names = self.interner.names
+        for app_id, start, end in zip(self.apps, self.starts, self.ends):
+            yield names[app_id], start, end
+
+
+def split_hours(start, end):
+    """Yields (hour start, seconds) for each local hour an interval touches."""
+    hour = datetime.fromtimestamp(start).replace(minute=0, second=0, microsecond=0)
+    while start < end:
+        next_hour = (hour + timedelta(hours=1)).timestamp()
+        yield hour.timestamp(), min(end, next_hour) - start
+        start = next_hour
+        hour += timedelta(hours=1)
+
+
+class HourTable:
+    """Per-app seconds in hourly buckets: the tier sessions are rolled into
+    once they're past retention, so hour-of-day views still cover them."""
+
+    __slots__ = ('interner', 'hours', 'apps', 'seconds', 'index')
+
+    def __init__(self, interner=None):
+        self.interner = Interner() if interner is None else interner
+        self.clear()
+
+    def clear(self):
+        self.hours = array('d')
+        self.apps = array('I')
+        self.seconds = array('d')
+        self.index = {}
+
+    def add(self, hour, app_id, seconds):
+        position = self.index.get((hour, app_id))
+        if position is None:
+            self.index[(hour, app_id)] = len(self.hours)
+            self.hours.append(hour)
+            self.apps.append(app_id)
+            self.seconds.append(seconds)
+        else:
+            self.seconds[position] += seconds
+
+    def add_span(self, app_id, start, end):
+        for hour, seconds in split_hours(start, end):
+            self.add(hour, app_id, seconds)
+
+    def drop_before(self, cutoff):
+        kept = [(hour, app_id, seconds) for hour, app_id, seconds in zip(self.hours, self.apps, self.seconds)
+                if hour >= cutoff]
+        self.clear()
+        for hour, app_id, seconds in kept:
+            self.add(hour, app_id, seconds)
+
+    def totals_between(self, t0, t1):
+        totals = {}
+        for hour, seconds in zip(self.hours, self.seconds):
+            if t0 <= hour < t1:
+                totals[hour] = totals.get(hour, 0.0) + seconds
+        return totals
+
+    def __len__(self):
+        return len(self.hours)
+
+    def __iter__(self):
+        names = self.interner.names
+        for hour, app_id, seconds in zip(self.hours, self.apps, self.seconds):
+            yield hour, names[app_id], seconds
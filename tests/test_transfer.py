@@ -0,0 +1,149 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+from storage import open_store  # noqa: E402
+from transfer import LEDGER_NAME, ImportLedger, export_history, forget_imports, import_history  # noqa: E402
+
+DAY = '2026-10-01'
+# Noon on DAY and the next day in any timezone the tests run in.
+START = 1790856000.0
+NEXT_DAY = START + 86400
+
+
+class Machine:
+    """A store and its import ledger in a directory of their own."""
+
+    def __init__(self, kind, directory):
+        self.dir = str(directory)
+        os.makedirs(self.dir, exist_ok=True)
+        self.store = open_store(kind, self.dir)
+        self.store.load()
+        self.exports = 0
+
+    def ledger(self):
+        return ImportLedger(os.path.join(self.dir, LEDGER_NAME))
+
+    def export(self):
+        self.exports += 1
+        path = os.path.join(self.dir, f"export{self.exports}.ndjson.gz")
+        ledger = self.ledger()
+        try:
+            export_history(self.store, path, ledger=ledger)
+        finally:
+            ledger.close()
+        return path
+
+    def import_(self, path):
+        ledger = self.ledger()
+        try:
+            return import_history(self.store, path, ledger)
+        finally:
+            ledger.close()
+
+    def clear(self):
+        self.store.clear()
+        forget_imports(self.store, self.dir)
+
+    def total(self, app):
+        return self.store.app_total(app)
+
+    def sessions(self):
+        return sorted(tuple(session) for session in self.store.sessions())
+
+    def close(self):
+        self.store.close()
+
+
+@pytest.fixture(params=['log', 'sqlite'])
+def machines(request, tmp_path):
+    opened = {}
+
+    def machine(name):
+        if name not in opened:
+            opened[name] = Machine(request.param, tmp_path / name)
+        return opened[name]
+    yield machine
+    for m in opened.values():
+        m.close()
+
+
+def test_reimport_is_idempotent(machines):
+    a, b = machines('a'), machines('b')
+    a.store.add_usage(DAY, 'a.exe', 100.0)
+    a.store.add_sessions([('a.exe', START, START + 100)])
+    path = a.export()
+    b.import_(path)
+    stats = b.import_(path)
+    assert stats['usage'] == 0 and stats['sessions'] == 0
+    assert b.total('a.exe') == pytest.approx(100.0)
+    assert b.sessions() == [('a.exe', START, START + 100)]
+
+
+def test_reimport_adds_only_growth(machines):
+    a, b = machines('a'), machines('b')
+    a.store.add_usage(DAY, 'a.exe', 100.0)
+    a.store.add_sessions([('a.exe', START, START + 100)])
+    b.import_(a.export())
+    a.store.add_usage(DAY, 'a.exe', 50.0)
+    a.store.add_sessions([('a.exe', START + 200, START + 250)])
+    b.import_(a.export())
+    assert b.total('a.exe') == pytest.approx(150.0)
+    assert len(b.sessions()) == 2
+
+
+def test_round_trip_back_to_origin(machines):
+    a, b = machines('a'), machines('b')
+    a.store.add_usage(DAY, 'a.exe', 100.0)
+    a.store.add_sessions([('a.exe', START, START + 100)])
+    b.store.add_usage(DAY, 'a.exe', 30.0)
+    b.store.add_sessions([('a.exe', START + 500, START + 530)])
+    b.import_(a.export())
+    a.import_(b.export())
+    assert a.total('a.exe') == pytest.approx(130.0)
+    assert a.sessions() == [('a.exe', START, START + 100), ('a.exe', START + 500, START + 530)]
+    # And back again: nothing new either way.
+    b.import_(a.export())
+    assert b.total('a.exe') == pytest.approx(130.0)
+    assert len(b.sessions()) == 2
+
+
+def test_merge_two_machines_that_share_history(machines):
+    a, b, c = machines('a'), machines('b'), machines('c')
+    a.store.add_usage(DAY, 'a.exe', 100.0)
+    a.store.add_sessions([('a.exe', START, START + 100)])
+    b.import_(a.export())
+    b.store.add_usage(DAY, 'a.exe', 20.0)
+    c.import_(a.export())
+    c.import_(b.export())
+    assert c.total('a.exe') == pytest.approx(120.0)
+    assert c.sessions() == [('a.exe', START, START + 100)]
+
+
+def test_restore_after_clear(machines):
+    a = machines('a')
+    a.store.add_usage(DAY, 'a.exe', 100.0)
+    a.store.add_sessions([('a.exe', START, START + 100)])
+    backup = a.export()
+    a.clear()
+    a.import_(backup)
+    a.import_(backup)
+    assert a.total('a.exe') == pytest.approx(100.0)
+    assert a.sessions() == [('a.exe', START, START + 100)]
+
+
+def test_sessions_out_of_day_order(machines):
+    a, b = machines('a'), machines('b')
+    # Appended to the log out of start order, as an import or a late
+    # session leaves it.
+    a.store.add_sessions([('a.exe', NEXT_DAY, NEXT_DAY + 60)])
+    a.store.add_sessions([('a.exe', START, START + 60)])
+    b.import_(a.export())
+    a.store.add_sessions([('b.exe', START + 600, START + 660)])
+    stats = b.import_(a.export())
+    assert stats['sessions'] == 1
+    assert b.sessions() == [('a.exe', START, START + 60), ('a.exe', NEXT_DAY, NEXT_DAY + 60),
+                            ('b.exe', START + 600, START + 660)]